@@ -0,0 +1,149 @@
+"""経済指標カレンダーの解析ベンチマーク
+
+保存済みのみんかぶのページ（fixtures/minkabu_*.html）を使い、
+XPathによる解析（data_fetcher.parse_economic_indicators）と
+従来のBeautifulSoupによる全体走査を比較する。
+両者の解析結果が一致しない、または指標が1件も取れないページがあれば終了コード1で終わる。
+fixtures/minkabu_sample.html は同じ構造の合成ページ（値は架空）。
+
+使い方（backendディレクトリで実行）:
+    python -m benchmarks.bench_indicators --record   # 現在のページをfixturesに保存
+    python -m benchmarks.bench_indicators [HTMLファイル ...]
+"""
+import argparse
+import glob
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def parse_with_beautifulsoup(content):
+    """従来の実装（BeautifulSoupで全体を構築してからfind_allで走査）"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(content, 'lxml')
+    indicators = []
+    for table in soup.find_all('table', class_='tbl-border'):
+        caption = table.find('caption')
+        date = caption.text.strip() if caption else ''
+        for row in table.find_all('tr', attrs={'data_importance': True}):
+            importance = int(row['data_importance'])
+            if importance >= 3:
+                cols = row.find_all('td')
+                fluctuation_span = cols[4].find('span')
+                indicators.append({
+                    'date': date,
+                    'time': cols[0].text.strip(),
+                    'country': row['data_country'],
+                    'name': cols[2].text.strip(),
+                    'importance': importance,
+                    'previous_fluctuation': fluctuation_span.text.strip() if fluctuation_span else '---',
+                    'previous_value': cols[5].text.strip(),
+                    'forecast': cols[6].text.strip(),
+                    'result': cols[7].text.strip()
+                })
+    return indicators
+
+
+def parse_with_xpath(content):
+    from data_fetcher import parse_economic_indicators
+    return parse_economic_indicators(content)
+
+
+PARSERS = {
+    'beautifulsoup': parse_with_beautifulsoup,
+    'xpath': parse_with_xpath,
+}
+
+
+def measure_memory(parser_name, path):
+    """新しいプロセスで1回解析し、Pythonヒープのピークと最大RSSの増分（KB）を返す"""
+    with open(path, 'rb') as f:
+        content = f.read()
+    parser = PARSERS[parser_name]
+    # インポート等の初期化コストを除くため、空のページで一度実行しておく
+    parser(b'<html><body></body></html>')
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    parser(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024, rss_after - rss_before
+
+
+def measure_time(parser, content, repeat):
+    """repeat回解析し、1回あたりの中央値（ms）を返す"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        parser(content)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def record():
+    """現在のみんかぶのページをfixturesに保存"""
+    from curl_cffi import requests
+    from config import MINKABU_INDICATORS_URL
+
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    response = requests.get(MINKABU_INDICATORS_URL, impersonate="safari15_5", timeout=30)
+    response.raise_for_status()
+    path = os.path.join(FIXTURES_DIR, f"minkabu_{datetime.now().strftime('%Y%m%d_%H%M%S')}.html")
+    with open(path, 'wb') as f:
+        f.write(response.content)
+    print(f"Saved {path} ({len(response.content)} bytes)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('pages', nargs='*', help='解析するHTMLファイル（省略時はfixtures/minkabu_*.html）')
+    parser.add_argument('--repeat', type=int, default=20, help='時間計測の繰り返し回数')
+    parser.add_argument('--record', action='store_true', help='現在のページをfixturesに保存して終了')
+    args = parser.parse_args()
+
+    if args.record:
+        record()
+        return
+
+    pages = args.pages or sorted(glob.glob(os.path.join(FIXTURES_DIR, 'minkabu_*.html')))
+    if not pages:
+        print("No fixture pages found. Run with --record first.", file=sys.stderr)
+        sys.exit(1)
+
+    context = multiprocessing.get_context('spawn')
+    failures = []
+    print(f"{'page':<40} {'parser':<14} {'rows':>5} {'median ms':>10} {'py peak KB':>11} {'RSS +KB':>8}")
+    for path in pages:
+        with open(path, 'rb') as f:
+            content = f.read()
+
+        results = {name: parse(content) for name, parse in PARSERS.items()}
+        if results['xpath'] != results['beautifulsoup']:
+            failures.append(f"parsers disagree on {path}")
+        if not results['xpath']:
+            failures.append(f"no indicators parsed from {path}")
+
+        for name, parse in PARSERS.items():
+            elapsed = measure_time(parse, content, args.repeat)
+            with context.Pool(1) as pool:
+                py_peak, rss_delta = pool.apply(measure_memory, (name, path))
+            print(f"{os.path.basename(path):<40} {name:<14} {len(results[name]):>5} {elapsed:>10.2f} {py_peak:>11} {rss_delta:>8}")
+
+    for failure in failures:
+        print(f"FAILED: {failure}", file=sys.stderr)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
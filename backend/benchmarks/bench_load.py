@@ -0,0 +1,189 @@
+"""APIサーバーのワーカー数ごとの負荷ベンチマーク
+
+公開済みのスナップショット（latest.jsonが指すデータファイル）を使ってuvicornを
+ワーカー数を変えて起動し、/api/data とセクションのエンドポイントに複数の
+クライアントプロセスから一定時間リクエストを送り続けて、リクエスト数/秒を計測する。
+あわせてワーカーのRSS（うちファイルのマップ分）を出力する。
+
+クライアントも同じマシンで動くため、コア数に対してワーカー数＋クライアント数が
+多すぎると頭打ちになる。
+
+使い方（backendディレクトリで実行）:
+    python -m benchmarks.bench_load [--data-dir ../data] [--workers 1,2,4] [--duration 10] [--json result.json]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 計測するリクエスト（パス, ヘッダー）
+CASES = [
+    ('/api/data', {}),
+    ('/api/data', {'Accept-Encoding': 'gzip, br'}),
+    ('/api/market', {'Accept-Encoding': 'gzip, br'}),
+    ('/api/news', {'Accept-Encoding': 'gzip, br'}),
+    ('/api/indicators', {'Accept-Encoding': 'gzip, br'}),
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(data_dir, workers, port):
+    """uvicornをworkers個のワーカーで起動し、応答するまで待つ"""
+    import httpx
+
+    env = dict(os.environ, DATA_DIR=os.path.abspath(data_dir))
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(port),
+         '--workers', str(workers), '--log-level', 'warning'],
+        cwd=BACKEND_DIR,
+        env=env
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f'http://127.0.0.1:{port}/api/health').status_code == 200:
+                return server
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f"Server with {workers} workers did not start")
+
+
+def worker_memory(server):
+    """ワーカープロセスのRSSとうちファイルのマップ分（MB、Linuxのみ）"""
+    rss = rss_file = 0
+    try:
+        with open(f'/proc/{server.pid}/task/{server.pid}/children') as f:
+            pids = f.read().split()
+        for pid in pids:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    name, _, value = line.partition(':')
+                    if name == 'VmRSS':
+                        rss += int(value.split()[0])
+                    elif name == 'RssFile':
+                        rss_file += int(value.split()[0])
+    except OSError:
+        return None
+    return {'rss_mb': round(rss / 1024, 1), 'rss_file_mb': round(rss_file / 1024, 1)}
+
+
+def run_client(url, headers, connections, duration, results):
+    """1つのクライアントプロセス。connections本の接続でduration秒間リクエストを送り続ける"""
+    import httpx
+
+    async def run():
+        limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+        async with httpx.AsyncClient(limits=limits, headers=headers) as client:
+            deadline = time.perf_counter() + duration
+            completed = 0
+
+            async def connection():
+                nonlocal completed
+                while time.perf_counter() < deadline:
+                    response = await client.get(url)
+                    if response.status_code != 200:
+                        raise RuntimeError(f"{url}: HTTP {response.status_code}")
+                    completed += 1
+
+            await asyncio.gather(*(connection() for _ in range(connections)))
+            return completed
+
+    results.put(asyncio.run(run()))
+
+
+def benchmark_case(port, path, headers, clients, connections, duration):
+    """clients個のプロセスから同時にリクエストし、全体のリクエスト数/秒を返す"""
+    url = f'http://127.0.0.1:{port}{path}'
+    results = multiprocessing.Queue()
+    processes = [
+        multiprocessing.Process(target=run_client, args=(url, headers, connections, duration, results))
+        for _ in range(clients)
+    ]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    completed = sum(results.get() for _ in processes)
+    for process in processes:
+        process.join()
+    return round(completed / (time.perf_counter() - started), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data-dir', default=None, help='latest.jsonのあるデータディレクトリ（省略時はconfig.DATA_DIR）')
+    parser.add_argument('--workers', default=None, help='計測するワーカー数（カンマ区切り、省略時は1からコア数まで倍々）')
+    parser.add_argument('--clients', type=int, default=max(1, (os.cpu_count() or 2) // 2), help='クライアントのプロセス数')
+    parser.add_argument('--connections', type=int, default=16, help='クライアント1つあたりの同時接続数')
+    parser.add_argument('--duration', type=float, default=10.0, help='エンドポイントごとの計測時間（秒）')
+    parser.add_argument('--json', help='結果をJSONで保存するパス')
+    args = parser.parse_args()
+
+    if args.data_dir is None:
+        from config import DATA_DIR
+        args.data_dir = DATA_DIR
+    if not os.path.exists(os.path.join(args.data_dir, 'latest.json')):
+        print(f"No published snapshot in {args.data_dir}. Run data_fetcher.py or bench_pipeline first.", file=sys.stderr)
+        sys.exit(1)
+
+    if args.workers:
+        worker_counts = [int(count) for count in args.workers.split(',')]
+    else:
+        worker_counts = [1]
+        while worker_counts[-1] * 2 <= (os.cpu_count() or 1):
+            worker_counts.append(worker_counts[-1] * 2)
+
+    results = []
+    for workers in worker_counts:
+        port = free_port()
+        server = start_server(args.data_dir, workers, port)
+        try:
+            # 全ワーカーがスナップショットをマップ・パースし終えてから計測する
+            for path, headers in CASES:
+                benchmark_case(port, path, headers, args.clients, args.connections, 1.0)
+            for path, headers in CASES:
+                results.append({
+                    'workers': workers,
+                    'path': path,
+                    'headers': headers,
+                    'requests_per_second': benchmark_case(
+                        port, path, headers, args.clients, args.connections, args.duration
+                    ),
+                    'memory': worker_memory(server)
+                })
+        finally:
+            server.terminate()
+            server.wait()
+
+    baseline = {
+        (result['path'], tuple(result['headers'])): result['requests_per_second']
+        for result in results if result['workers'] == worker_counts[0]
+    }
+    print(f"{'workers':>7} {'endpoint':<40} {'req/s':>10} {'scaling':>8} {'RSS MB':>8} {'file MB':>8}")
+    for result in results:
+        label = result['path'] + ''.join(f" [{k}]" for k in result['headers'])
+        scaling = result['requests_per_second'] / baseline[(result['path'], tuple(result['headers']))]
+        memory = result['memory'] or {'rss_mb': '-', 'rss_file_mb': '-'}
+        print(f"{result['workers']:>7} {label:<40} {result['requests_per_second']:>10} {scaling:>7.2f}x "
+              f"{memory['rss_mb']:>8} {memory['rss_file_mb']:>8}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'cpu_count': os.cpu_count(), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
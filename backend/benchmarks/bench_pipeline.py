@@ -0,0 +1,488 @@
+"""データ取得パイプラインとAPIのベンチマーク
+
+記録済みの上流レスポンスを再生し、外部サービスに接続せずに計測する。
+    - yfinance: 1時間足（yfinance.csv.gz、最後のバーが現在時刻になるようずらす）とニュース（news.json）
+    - みんかぶ・CNN: HTML（minkabu.html、なければ fixtures/minkabu_sample.html）・JSON（fear_greed.json）をローカルサーバーから配信
+    - CNN・Finviz: ローカルサーバーの代替ページをPlaywrightで撮影（CNNはJSONの取得に失敗した場合のみ）
+    - OpenAI: 固定の応答を返す
+fixtures/pipeline には --synthesize で作った合成データ（値は架空）を置いている。
+--record で実際の上流レスポンスに置き換えられる。
+
+fetch_raw_data・generate_report_asyncは段階ごとに新しいプロセスで実行し、経過時間・CPU時間と、
+子プロセス（Chromium・画像エンコード）を含むRSS合計の最大値を出力する。
+あわせて /api/data 等のレイテンシ・スループットを出力する。
+
+使い方（backendディレクトリで実行）:
+    python -m benchmarks.bench_pipeline --record      # 上流のレスポンスを記録
+    python -m benchmarks.bench_pipeline --synthesize  # 合成データを作り直す
+    python -m benchmarks.bench_pipeline [--upstream-latency 0.2] [--json result.json]
+"""
+import argparse
+import asyncio
+import csv
+import functools
+import gzip
+import http.server
+import io
+import json
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures', 'pipeline')
+# 記録したみんかぶのページがなければ、bench_indicatorsと共通の合成ページを使う
+MINKABU_SAMPLE_PAGE = os.path.join(os.path.dirname(__file__), 'fixtures', 'minkabu_sample.html')
+FIXTURE_FILES = ('yfinance.csv.gz', 'news.json', 'fear_greed.json')
+BAR_FIELDS = ('Open', 'High', 'Low', 'Close', 'Volume')
+
+# 合成データの各銘柄の基準価格
+SYNTHETIC_PRICES = {
+    'VX=F': 18.0,
+    'ZN=F': 110.0,
+    'ES=F': 5400.0,
+    'NQ=F': 19000.0,
+    'DX=F': 104.0,
+    'CL=F': 78.0,
+    'GC=F': 2350.0,
+}
+# 合成データの最後のバーの時刻（再生時に現在時刻へずらす）
+SYNTHETIC_END = datetime(2025, 6, 6, 20, tzinfo=timezone.utc)
+
+# Finvizの代替ページ（少し遅れてcanvasに描画する）
+FINVIZ_STAND_IN = """<!DOCTYPE html>
+<html><body>
+<div id="content"><canvas width="1200" height="700"></canvas></div>
+<script>
+setTimeout(() => {
+    const ctx = document.querySelector('canvas').getContext('2d');
+    for (let x = 0; x < 1200; x += 40) {
+        for (let y = 0; y < 700; y += 35) {
+            ctx.fillStyle = `hsl(${(x * 7 + y * 3) % 120}, 60%, 40%)`;
+            ctx.fillRect(x, y, 39, 34);
+        }
+    }
+}, 300);
+</script>
+</body></html>
+"""
+
+# CNN Fear & Greedの代替ページ（1秒間DOMを更新し続けてから止まる）
+FEAR_GREED_STAND_IN = """<!DOCTYPE html>
+<html><body>
+<div data-uri="cms.cnn.com/_components/fearandgreed" style="width:600px;height:300px">
+    <div id="score" style="font-size:96px">0</div>
+</div>
+<script>
+let score = 0;
+const timer = setInterval(() => {
+    document.getElementById('score').textContent = ++score;
+    if (score >= 50) clearInterval(timer);
+}, 20);
+</script>
+</body></html>
+"""
+
+CANNED_AI_REPLY = "VIXは落ち着いた水準で推移しており、市場センチメントは中立的です。（ベンチマーク用の固定応答）"
+
+
+def record():
+    """現在の上流レスポンスをfixturesに保存"""
+    import yfinance as yf
+    from curl_cffi import requests
+    from config import CNN_FEAR_GREED_URL, FEAR_GREED_HISTORY_DAYS, MARKET_INSTRUMENTS, MINKABU_INDICATORS_URL
+
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    session = requests.Session(impersonate="safari15_5")
+
+    frames = yf.download(
+        list(MARKET_INSTRUMENTS.values()),
+        period='1mo',
+        interval='1h',
+        group_by='ticker',
+        session=session,
+        progress=False
+    )
+    # pandasのバージョンに依存しないよう、(時刻, 銘柄)ごとの行のCSVで保存する
+    bars = frames.stack(level=0).rename_axis(['Datetime', 'Symbol']).reset_index()
+    bars.to_csv(os.path.join(FIXTURES_DIR, 'yfinance.csv.gz'), index=False, date_format='%Y-%m-%dT%H:%M:%S%z')
+
+    news = {
+        symbol: yf.Ticker(symbol, session=session).news
+        for symbol in ['^GSPC', '^IXIC', '^DJI']
+    }
+    with open(os.path.join(FIXTURES_DIR, 'news.json'), 'w', encoding='utf-8') as f:
+        json.dump(news, f, ensure_ascii=False)
+
+    response = session.get(MINKABU_INDICATORS_URL, timeout=30)
+    response.raise_for_status()
+    with open(os.path.join(FIXTURES_DIR, 'minkabu.html'), 'wb') as f:
+        f.write(response.content)
+
+    start = (datetime.now() - timedelta(days=FEAR_GREED_HISTORY_DAYS)).strftime('%Y-%m-%d')
+    response = session.get(f"{CNN_FEAR_GREED_URL}{start}", headers={'Referer': 'https://edition.cnn.com/'}, timeout=30)
+    response.raise_for_status()
+    with open(os.path.join(FIXTURES_DIR, 'fear_greed.json'), 'wb') as f:
+        f.write(response.content)
+
+    print(f"Recorded upstream responses to {FIXTURES_DIR}")
+
+
+def synthesize(days=30, seed=0):
+    """記録と同じ形式の合成データ（値は架空）をfixturesに保存する"""
+    rng = random.Random(seed)
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+
+    # 平日の0-22時（UTC）の1時間足をランダムウォークで作る
+    start = SYNTHETIC_END - timedelta(days=days)
+    hours = [
+        start + timedelta(hours=i)
+        for i in range(days * 24 + 1)
+        if (start + timedelta(hours=i)).weekday() < 5 and (start + timedelta(hours=i)).hour < 23
+    ]
+    rows = []
+    for symbol, price in SYNTHETIC_PRICES.items():
+        for hour in hours:
+            open_ = price
+            price = max(price * (1 + rng.gauss(0, 0.004)), 0.01)
+            high = max(open_, price) * (1 + abs(rng.gauss(0, 0.0015)))
+            low = min(open_, price) * (1 - abs(rng.gauss(0, 0.0015)))
+            rows.append([hour.strftime('%Y-%m-%dT%H:%M:%S%z'), symbol, round(open_, 4), round(high, 4),
+                         round(low, 4), round(price, 4), rng.randint(100, 50000)])
+    # 作り直しても同じバイト列になるよう、gzipのヘッダーに時刻を入れない
+    with open(os.path.join(FIXTURES_DIR, 'yfinance.csv.gz'), 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as compressed:
+            with io.TextIOWrapper(compressed, encoding='utf-8', newline='') as f:
+                writer = csv.writer(f, lineterminator='\n')
+                writer.writerow(['Datetime', 'Symbol', *BAR_FIELDS])
+                writer.writerows(rows)
+
+    # 指数ごとのニュース（指数をまたいで重複する記事を含む）
+    published = int(SYNTHETIC_END.timestamp())
+    news = {}
+    for index, symbol in enumerate(['^GSPC', '^IXIC', '^DJI']):
+        news[symbol] = [
+            {
+                'title': f"Synthetic headline {index * 3 + i} for {symbol}" if i else "Synthetic headline shared by all indices",
+                'publisher': 'Benchmark Wire',
+                'link': f"https://example.com/news/{index * 3 + i}",
+                'providerPublishTime': published - (index * 3 + i) * 1800
+            }
+            for i in range(4)
+        ]
+    with open(os.path.join(FIXTURES_DIR, 'news.json'), 'w', encoding='utf-8') as f:
+        json.dump(news, f, ensure_ascii=False, indent=1)
+
+    # CNNのgraphdataと同じ形の1年分の日次スコア
+    def rating(score):
+        return ('extreme fear' if score < 25 else 'fear' if score < 45 else
+                'neutral' if score <= 55 else 'greed' if score <= 75 else 'extreme greed')
+
+    score = 50.0
+    history = []
+    for day in range(365, -1, -1):
+        score = min(max(score + rng.gauss(0, 3), 1), 99)
+        timestamp = (SYNTHETIC_END - timedelta(days=day)).timestamp() * 1000
+        history.append({'x': timestamp, 'y': round(score, 4), 'rating': rating(score)})
+    payload = {
+        'fear_and_greed': {
+            'score': history[-1]['y'],
+            'rating': history[-1]['rating'],
+            'timestamp': SYNTHETIC_END.isoformat(),
+            'previous_close': history[-2]['y'],
+            'previous_1_week': history[-8]['y'],
+            'previous_1_month': history[-31]['y'],
+            'previous_1_year': history[0]['y']
+        },
+        'fear_and_greed_historical': {'score': history[-1]['y'], 'rating': history[-1]['rating'], 'data': history}
+    }
+    for name in ('market_momentum_sp500', 'stock_price_strength', 'stock_price_breadth', 'put_call_options',
+                 'market_volatility_vix', 'junk_bond_demand', 'safe_haven_demand'):
+        value = round(rng.uniform(5, 95), 4)
+        payload[name] = {'score': value, 'rating': rating(value), 'data': history[-30:]}
+    with open(os.path.join(FIXTURES_DIR, 'fear_greed.json'), 'w', encoding='utf-8') as f:
+        json.dump(payload, f)
+
+    print(f"Synthesized fixtures in {FIXTURES_DIR} ({len(rows)} bars)")
+
+
+def minkabu_fixture():
+    recorded = os.path.join(FIXTURES_DIR, 'minkabu.html')
+    return recorded if os.path.exists(recorded) else MINKABU_SAMPLE_PAGE
+
+
+def start_stand_in_server(directory):
+    """代替ページ・記録済みHTMLを配信するローカルサーバーを起動し、ベースURLを返す"""
+    class QuietHandler(http.server.SimpleHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    handler = functools.partial(QuietHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def install_replay(data_fetcher, base_url, upstream_latency):
+    """data_fetcherの上流呼び出しを記録済みレスポンスに差し替える"""
+    import pandas as pd
+
+    bars = pd.read_csv(os.path.join(FIXTURES_DIR, 'yfinance.csv.gz'))
+    bars['Datetime'] = pd.to_datetime(bars['Datetime'], utc=True)
+    # yf.download(group_by='ticker')と同じ（銘柄, 項目）の列にする
+    frames = bars.set_index(['Datetime', 'Symbol']).unstack('Symbol').swaplevel(axis=1).sort_index(axis=1)
+    # 保存期間で切り捨てられないよう、最後のバーが現在時刻になるようにずらす
+    frames.index += pd.Timestamp.now(tz='UTC').floor('h') - frames.index[-1]
+    with open(os.path.join(FIXTURES_DIR, 'news.json'), 'r', encoding='utf-8') as f:
+        news = json.load(f)
+
+    def download(tickers, **kwargs):
+        time.sleep(upstream_latency)
+        return frames.loc[:, frames.columns.get_level_values(0).isin(tickers)]
+
+    class Ticker:
+        def __init__(self, symbol, session=None):
+            self.symbol = symbol
+
+        @property
+        def news(self):
+            time.sleep(upstream_latency)
+            return news.get(self.symbol, [])
+
+    class CannedCompletions:
+        async def create(self, model, messages, **params):
+            await asyncio.sleep(upstream_latency)
+            message = SimpleNamespace(content=CANNED_AI_REPLY)
+            return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason='stop')])
+
+    data_fetcher.yf = SimpleNamespace(download=download, Ticker=Ticker)
+    data_fetcher.client = SimpleNamespace(chat=SimpleNamespace(completions=CannedCompletions()))
+    data_fetcher.MINKABU_INDICATORS_URL = f"{base_url}/minkabu.html"
+    # 取得時に開始日が付加されるため、クエリ文字列として受ける
+    data_fetcher.CNN_FEAR_GREED_URL = f"{base_url}/fear_greed.json?start="
+    data_fetcher.CNN_FEAR_GREED_PAGE_URL = f"{base_url}/fear_greed.html"
+    data_fetcher.FINVIZ_HEATMAP_URLS = {
+        index_name: {period: f"{base_url}/finviz.html?t={index_name}&p={period}" for period in ('day', 'week', 'month')}
+        for index_name in ('sp500', 'nasdaq100')
+    }
+
+
+def tree_rss_kb(root_pid):
+    """プロセスとその子孫のRSSの合計（KB、/procがなければNone）"""
+    total = 0
+    pending = [str(root_pid)]
+    if not os.path.exists(f'/proc/{root_pid}/status'):
+        return None
+    while pending:
+        pid = pending.pop()
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+            for task in os.listdir(f'/proc/{pid}/task'):
+                with open(f'/proc/{pid}/task/{task}/children') as f:
+                    pending.extend(f.read().split())
+        except OSError:
+            # 計測中に終了したプロセス
+            continue
+    return total
+
+
+class TreeRSSSampler:
+    """このプロセスと子孫プロセスのRSS合計を一定間隔で計測し、最大値を保持する"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak_kb = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while True:
+            rss = tree_rss_kb(os.getpid())
+            if rss is not None:
+                self.peak_kb = max(self.peak_kb or 0, rss)
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+
+
+def measure_stage(name, func):
+    """関数を実行し、経過時間・CPU時間・最大RSSを返す
+
+    CPU時間はこのプロセスと、終了済みの子プロセス（Chromium等）に分けて返す。
+    peak_rss_mbは子孫プロセスを含むRSS合計の最大値、process_peak_rss_mbはこのプロセスのみの最大値。
+    """
+    wall_started = time.perf_counter()
+    cpu_started = time.process_time()
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    with TreeRSSSampler() as sampler:
+        func()
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    children_cpu = (children_after.ru_utime + children_after.ru_stime) - (children_before.ru_utime + children_before.ru_stime)
+    return {
+        'stage': name,
+        'wall_seconds': round(time.perf_counter() - wall_started, 3),
+        'cpu_seconds': round(time.process_time() - cpu_started, 3),
+        'children_cpu_seconds': round(children_cpu, 3),
+        'peak_rss_mb': round(sampler.peak_kb / 1024, 1) if sampler.peak_kb is not None else None,
+        'process_peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+
+
+def run_stage(name, base_url, upstream_latency, skip_screenshots):
+    """新しいプロセスで1段階を実行し、計測値を返す（前の段階の最大RSSを引き継がないため）"""
+    import data_fetcher
+    install_replay(data_fetcher, base_url, upstream_latency)
+
+    fetcher = data_fetcher.MarketDataFetcher()
+    if skip_screenshots:
+        async def skip():
+            pass
+        fetcher.fetch_all_async = skip
+
+    stages = {
+        'fetch_raw_data': fetcher.fetch_raw_data,
+        'generate_report_async': lambda: asyncio.run(fetcher.generate_report_async()),
+    }
+    return measure_stage(name, stages[name])
+
+
+async def benchmark_endpoint(client, path, requests, concurrency, headers=None):
+    """同時接続数concurrencyでrequests回リクエストし、レイテンシとスループットを返す"""
+    latencies = []
+    queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(None)
+
+    async def worker():
+        while not queue.empty():
+            queue.get_nowait()
+            started = time.perf_counter()
+            response = await client.get(path, headers=headers)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code not in (200, 304):
+                raise RuntimeError(f"{path}: HTTP {response.status_code}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'path': path,
+        'headers': headers or {},
+        'requests_per_second': round(requests / elapsed, 1),
+        'p50_ms': round(latencies[len(latencies) // 2], 2),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95)], 2),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99)], 2)
+    }
+
+
+async def benchmark_api(requests, concurrency):
+    """ASGIアプリを直接呼び出してAPIのレイテンシ・スループットを計測"""
+    import httpx
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        etag = (await client.get('/api/data')).headers['etag']
+        cases = [
+            ('/api/data', None),
+            ('/api/data', {'Accept-Encoding': 'gzip'}),
+            ('/api/data', {'If-None-Match': etag}),
+            ('/api/data?fields=date,last_updated,market,screenshots', {'Accept-Encoding': 'gzip'}),
+            ('/api/market', {'Accept-Encoding': 'gzip'}),
+            ('/api/news', {'Accept-Encoding': 'gzip'}),
+        ]
+        return [
+            await benchmark_endpoint(client, path, requests, concurrency, headers)
+            for path, headers in cases
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--record', action='store_true', help='上流のレスポンスを記録して終了')
+    parser.add_argument('--synthesize', action='store_true', help='合成データをfixturesに作り直して終了')
+    parser.add_argument('--upstream-latency', type=float, default=0.0, help='再生時に上流呼び出しごとに加える遅延（秒）')
+    parser.add_argument('--skip-screenshots', action='store_true', help='Playwrightによる撮影を行わない')
+    parser.add_argument('--requests', type=int, default=500, help='APIベンチマークのエンドポイントごとのリクエスト数')
+    parser.add_argument('--concurrency', type=int, default=20, help='APIベンチマークの同時接続数')
+    parser.add_argument('--json', help='結果をJSONで保存するパス')
+    args = parser.parse_args()
+
+    if args.record:
+        record()
+        return
+    if args.synthesize:
+        synthesize()
+        return
+
+    for name in FIXTURE_FILES:
+        if not os.path.exists(os.path.join(FIXTURES_DIR, name)):
+            print(f"Missing fixture {name}. Run with --synthesize or --record first.", file=sys.stderr)
+            sys.exit(1)
+
+    # 設定の読み込み前にデータの保存先を一時ディレクトリに向ける
+    data_dir = tempfile.mkdtemp(prefix='hanaview_bench_')
+    site_dir = tempfile.mkdtemp(prefix='hanaview_site_')
+    os.environ['DATA_DIR'] = data_dir
+    os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+    shutil.copy(minkabu_fixture(), os.path.join(site_dir, 'minkabu.html'))
+    shutil.copy(os.path.join(FIXTURES_DIR, 'fear_greed.json'), site_dir)
+    with open(os.path.join(site_dir, 'finviz.html'), 'w', encoding='utf-8') as f:
+        f.write(FINVIZ_STAND_IN)
+    with open(os.path.join(site_dir, 'fear_greed.html'), 'w', encoding='utf-8') as f:
+        f.write(FEAR_GREED_STAND_IN)
+    server, base_url = start_stand_in_server(site_dir)
+
+    try:
+        # 段階ごとに新しいプロセスで実行する（ワーカーは子プロセスを起動できるよう非daemon）
+        stages = []
+        for name in ('fetch_raw_data', 'generate_report_async'):
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                stages.append(executor.submit(
+                    run_stage, name, base_url, args.upstream_latency, args.skip_screenshots
+                ).result())
+        api = asyncio.run(benchmark_api(args.requests, args.concurrency))
+    finally:
+        server.shutdown()
+        shutil.rmtree(site_dir, ignore_errors=True)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    print(f"{'stage':<24} {'wall s':>8} {'cpu s':>8} {'child cpu s':>12} {'peak RSS MB':>12} {'process MB':>11}")
+    for stage in stages:
+        print(f"{stage['stage']:<24} {stage['wall_seconds']:>8} {stage['cpu_seconds']:>8} "
+              f"{stage['children_cpu_seconds']:>12} {str(stage['peak_rss_mb']):>12} {stage['process_peak_rss_mb']:>11}")
+
+    print()
+    print(f"{'endpoint':<60} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for result in api:
+        label = result['path'] + ''.join(f" [{k}]" for k in result['headers'])
+        print(f"{label:<60} {result['requests_per_second']:>8} {result['p50_ms']:>8} {result['p95_ms']:>8} {result['p99_ms']:>8}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'stages': stages, 'api': api}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -9,13 +9,27 @@ load_dotenv()
 # OpenAI API設定
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 OPENAI_MODEL = 'gpt-5-mini'
+# 1回の呼び出しのタイムアウト（秒）と、リトライを含めた最大試行回数
+OPENAI_TIMEOUT_SECONDS = 60
+OPENAI_MAX_ATTEMPTS = 3
+# 同一プロンプトの応答を再利用する期間（秒）
+AI_CACHE_TTL_SECONDS = 24 * 60 * 60
 
 # タイムゾーン設定
 TZ_JST = pytz.timezone('Asia/Tokyo')
 TZ_US_EASTERN = pytz.timezone('US/Eastern')
 
 # データ保存先
-DATA_DIR = '../data'
+DATA_DIR = os.getenv('DATA_DIR', '../data')
+# 最新のデータファイルを指すマニフェスト（save_dataが更新する）
+LATEST_MANIFEST_FILE = 'latest.json'
+# データファイル・スクリーンショットの保持日数
+DATA_RETENTION_DAYS = 7
+# APIサーバーがパース済みデータを保持するメモリの上限（バイト）
+SNAPSHOT_CACHE_MAX_BYTES = int(os.getenv('SNAPSHOT_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+# 新しいデータの公開を確認する間隔と、Server-Sent Eventsのkeepalive間隔（秒）
+SNAPSHOT_POLL_SECONDS = 5
+SSE_KEEPALIVE_SECONDS = 25
 
 # 市場時間設定（夏時間・冬時間考慮）
 def is_dst():
@@ -32,9 +46,70 @@ def get_market_close_time_jst():
         # 冬時間: 米国16:00 = 日本6:00（翌日）
         return 6
 
+# 市場データとして取得する銘柄（self.data['market']のキー: yfinanceのシンボル）
+# fetch_market_dataで全銘柄を1回のyf.downloadでまとめて取得する
+MARKET_INSTRUMENTS = {
+    'vix': 'VX=F',
+    't_note_future': 'ZN=F',
+    'sp500_future': 'ES=F',
+    'nasdaq100_future': 'NQ=F',
+    'dollar_index_future': 'DX=F',
+    'crude_oil_future': 'CL=F',
+    'gold_future': 'GC=F',
+}
+
+# 1時間足の蓄積先（SQLite）。取得は前回保存分以降の差分のみ
+OHLC_DB_PATH = os.path.join(DATA_DIR, 'ohlc.sqlite3')
+# 未保存の銘柄を初回取得する期間（yfinanceの1時間足は最大730日）
+OHLC_INITIAL_PERIOD = '1y'
+# 履歴として保存する期間（日数）を時間足ごとに指定（/api/history/{銘柄}/{時間足}で配信）
+OHLC_HISTORY_DAYS = {'1h': 10, '4h': 90, '1d': 365}
+# ダッシュボードのチャートに使う銘柄・時間足・期間（日数）。marketセクションにはこの分だけ載せる
+MARKET_CHART_INSTRUMENTS = ('vix', 't_note_future')
+OHLC_CHART_TIMEFRAME = '4h'
+OHLC_CHART_DAYS = 10
+
+# 取得元ごとのタイムアウト（秒）。fetchステージでは各取得元を並列に実行する
+FETCH_SOURCE_TIMEOUTS = {
+    'market': 120,
+    'indicators': 45,
+    'news': 45,
+    'fear_greed': 30,
+}
+
 # yfinanceのディレイ（15分）を考慮した取得時間
 DATA_FETCH_DELAY_MINUTES = 15
 
+# 場中（米国の取引時間中）の差分更新の間隔（分）。0で無効
+INTRADAY_REFRESH_MINUTES = int(os.getenv('INTRADAY_REFRESH_MINUTES', '0'))
+# 場中に取り直す取得元（スクリーンショット・AI生成は行わない）
+INTRADAY_REFRESH_SOURCES = ('market', 'indicators', 'fear_greed')
+
 # API URLs
 CNN_FEAR_GREED_URL = 'https://production.dataviz.cnn.io/index/fearandgreed/graphdata/'
-MINKABU_INDICATORS_URL = 'https://fx.minkabu.jp/indicators'
\ No newline at end of file
+# Fear & Greed Indexの履歴を取得する日数
+FEAR_GREED_HISTORY_DAYS = 365
+MINKABU_INDICATORS_URL = 'https://fx.minkabu.jp/indicators'
+
+# スクリーンショット設定
+# 1つのブラウザで同時に開くタブ数の上限
+SCREENSHOT_CONCURRENCY = int(os.getenv('SCREENSHOT_CONCURRENCY', '4'))
+# 配信用に生成する画像サイズ（名前: 最大幅px、元画像より大きくはしない）
+SCREENSHOT_SIZES = {'thumb': 320, 'mobile': 828, 'desktop': 1600}
+SCREENSHOT_WEBP_QUALITY = 80
+SCREENSHOT_AVIF_QUALITY = 60
+# 画像の再エンコードに使うプロセス数
+SCREENSHOT_ENCODE_WORKERS = int(os.getenv('SCREENSHOT_ENCODE_WORKERS', '2'))
+CNN_FEAR_GREED_PAGE_URL = 'https://edition.cnn.com/markets/fear-and-greed'
+FINVIZ_HEATMAP_URLS = {
+    'sp500': {
+        'day': 'https://finviz.com/map.ashx?t=sec',
+        'week': 'https://finviz.com/map.ashx?t=sec&st=w1',
+        'month': 'https://finviz.com/map.ashx?t=sec&st=w4'
+    },
+    'nasdaq100': {
+        'day': 'https://finviz.com/map.ashx?t=sec_ndx',
+        'week': 'https://finviz.com/map.ashx?t=sec_ndx&st=w1',
+        'month': 'https://finviz.com/map.ashx?t=sec_ndx&st=w4'
+    }
+}
\ No newline at end of file
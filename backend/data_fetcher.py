@@ -3,27 +3,520 @@ import logging
 from datetime import datetime, timedelta
 import yfinance as yf
 from curl_cffi import requests
-from bs4 import BeautifulSoup
+from lxml import html as lxml_html
 import pandas as pd
 import numpy as np
-from openai import OpenAI
+import openai
+from openai import AsyncOpenAI
 import pytz
 import asyncio
+import bisect
+import collections
+import contextlib
+import contextvars
+from functools import partial, partialmethod
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from playwright.async_api import async_playwright
 from playwright_stealth import stealth_async
-import base64
-from PIL import Image
-import io
+import hashlib
+import gzip
+import multiprocessing
+import tempfile
 import os
 import sys
+import time
 from config import *
+from image_pipeline import optimize_screenshot
+from ohlc_store import OHLCStore
+from run_metrics import RunRecorder
+from snapshot_format import (
+    PRECOMPRESSED_SUFFIXES,
+    RETAINED_FILE_PATTERN,
+    brotli,
+    content_version,
+    serialize_json,
+    snapshot_filename
+)
 
 # ログ設定
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# OpenAI クライアント初期化
-client = OpenAI(api_key=OPENAI_API_KEY)
+# OpenAI クライアント初期化（リトライはchat_completionで回数を制御する）
+client = AsyncOpenAI(api_key=OPENAI_API_KEY, timeout=OPENAI_TIMEOUT_SECONDS, max_retries=0)
+
+
+class IncompleteCompletionError(Exception):
+    """応答が途中で打ち切られた（finish_reasonがstop以外）か、本文が空"""
+
+
+# 再試行するOpenAIのエラー（タイムアウト・接続エラー・レート制限・サーバーエラー・不完全な応答）
+RETRYABLE_OPENAI_ERRORS = (
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+    IncompleteCompletionError
+)
+
+# fetchモードの実行記録（generateモードで引き継ぐ）
+RAW_RUN_RECORD_FILE = 'run_raw.json'
+
+
+def atomic_write(path, content):
+    """一時ファイルに書き込んでから置き換え、読み手に書き込み途中の内容を見せない"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.tmp_')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+
+
+# チャート用に生成する時間足（キー: 出力名、値: pandasのリサンプルルール）
+OHLC_TIMEFRAMES = {'1h': '1H', '4h': '4H', '1d': '1D'}
+OHLC_AGG_RULES = {
+    'Open': 'first',
+    'High': 'max',
+    'Low': 'min',
+    'Close': 'last'
+}
+
+
+def resample_ohlc(hist, rule):
+    """1時間足のOHLCを指定の時間足にリサンプリング"""
+    return hist[list(OHLC_AGG_RULES)].resample(rule, label='left', closed='left').agg(OHLC_AGG_RULES).dropna()
+
+
+def ohlc_to_columns(frame):
+    """OHLCのDataFrameをlightweight-charts向けの列形式に変換（timeはエポック秒）"""
+    columns = {'time': (frame.index.asi8 // 1_000_000_000).tolist()}
+    for column in OHLC_AGG_RULES:
+        columns[column.lower()] = frame[column].to_numpy(dtype=float).round(6).tolist()
+    return columns
+
+
+def build_ohlc_history(hist):
+    """1時間足から全時間足の列形式データを生成（期間は時間足ごとにOHLC_HISTORY_DAYSで制限）"""
+    history = {}
+    for name, rule in OHLC_TIMEFRAMES.items():
+        since = hist.index[-1] - pd.Timedelta(days=OHLC_HISTORY_DAYS[name])
+        history[name] = ohlc_to_columns(resample_ohlc(hist[hist.index >= since], rule))
+    return history
+
+
+def tail_columns(columns, days):
+    """列形式データのうち、最後のバーからdays日以内の分を返す"""
+    if not columns['time']:
+        return columns
+    start = bisect.bisect_left(columns['time'], columns['time'][-1] - days * 24 * 60 * 60)
+    return {key: values[start:] for key, values in columns.items()}
+
+
+def is_failed_value(value):
+    """取得元が失敗時に書き込む値（{'error': ...}・空のリスト）か"""
+    return (isinstance(value, dict) and 'error' in value) or value == []
+
+
+def successful_entries(result):
+    """取得元ごとの結果から失敗時の値を除く（セクション内は項目ごとに判定）"""
+    entries = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            value = {name: item for name, item in value.items() if not is_failed_value(item)}
+            if value:
+                entries[key] = value
+        elif not is_failed_value(value):
+            entries[key] = value
+    return entries
+
+
+def extract_ticker_frame(frames, symbol):
+    """yf.downloadの結果から1銘柄分のDataFrameを取り出す"""
+    if isinstance(frames.columns, pd.MultiIndex):
+        if symbol not in frames.columns.get_level_values(0):
+            return pd.DataFrame()
+        frames = frames[symbol]
+
+    # 一括取得では銘柄間で時刻が揃えられるため、欠損行を除く
+    return frames.dropna(how='all')
+
+
+# みんかぶの日付ごとの指標テーブルと、重要度3以上の行
+INDICATOR_TABLES_XPATH = "//table[contains(concat(' ', normalize-space(@class), ' '), ' tbl-border ')]"
+IMPORTANT_ROWS_XPATH = ".//tr[@data_importance >= 3]"
+
+
+def parse_economic_indicators(content):
+    """みんかぶの経済指標カレンダーから重要度3以上の指標を抽出
+
+    XPathで対象テーブルの重要度3以上の行だけを選び、その行のセルのみを読む。
+    """
+    tree = lxml_html.fromstring(content)
+
+    indicators = []
+
+    # 日付ごとにテーブルを処理
+    for table in tree.xpath(INDICATOR_TABLES_XPATH):
+        caption = table.find('.//caption')
+        date = caption.text_content().strip() if caption is not None else ''
+
+        for row in table.xpath(IMPORTANT_ROWS_XPATH):
+            cols = row.findall('.//td')
+
+            # 前回ドル円変動幅
+            fluctuation_span = cols[4].find('.//span')
+            previous_fluctuation = fluctuation_span.text_content().strip() if fluctuation_span is not None else '---'
+
+            indicators.append({
+                'date': date,
+                'time': cols[0].text_content().strip(),
+                'country': row.get('data_country'),
+                'name': cols[2].text_content().strip(),
+                'importance': int(row.get('data_importance')),
+                'previous_fluctuation': previous_fluctuation,
+                # 前回・予想・結果
+                'previous_value': cols[5].text_content().strip(),
+                'forecast': cols[6].text_content().strip(),
+                'result': cols[7].text_content().strip()
+            })
+
+    return indicators
+
+
+# Fear & Greed Indexを構成する指標（graphdataのキー）
+FEAR_GREED_INDICATORS = (
+    'market_momentum_sp500',
+    'stock_price_strength',
+    'stock_price_breadth',
+    'put_call_options',
+    'market_volatility_vix',
+    'junk_bond_demand',
+    'safe_haven_demand'
+)
+# 前日・1週間前・1ヶ月前・1年前の値（graphdataのキー -> 保存するキー）
+FEAR_GREED_PREVIOUS = {
+    'previous_close': 'close',
+    'previous_1_week': '1_week',
+    'previous_1_month': '1_month',
+    'previous_1_year': '1_year'
+}
+
+
+def round_score(value):
+    """スコアを小数1桁に丸める（欠損はNone）"""
+    return None if value is None else round(float(value), 1)
+
+
+def parse_fear_greed(payload):
+    """CNNのgraphdataから現在値・比較値・履歴（列形式、timeはエポック秒）・構成指標を取り出す"""
+    current = payload['fear_and_greed']
+    points = payload.get('fear_and_greed_historical', {}).get('data', [])
+    # チャートは時刻の昇順・重複なしが前提のため、並べ替えて同時刻の点をまとめる
+    history = dict(sorted((int(point['x'] // 1000), point['y']) for point in points))
+
+    return {
+        'score': round_score(current['score']),
+        'rating': current.get('rating'),
+        'timestamp': current.get('timestamp'),
+        'previous': {
+            name: round_score(current.get(key))
+            for key, name in FEAR_GREED_PREVIOUS.items()
+        },
+        'history': {
+            'time': list(history),
+            'score': [round_score(score) for score in history.values()]
+        },
+        'indicators': {
+            name: {
+                'score': round_score(payload[name].get('score')),
+                'rating': payload[name].get('rating')
+            }
+            for name in FEAR_GREED_INDICATORS
+            if name in payload
+        }
+    }
+
+
+READINESS_STRATEGIES = ('fixed', 'selector', 'canvas', 'networkidle', 'dom_stable')
+
+# キャンバスの数点をサンプリングし、描画済みかどうかを判定
+CANVAS_PAINTED_JS = """
+(selector) => {
+    const canvas = document.querySelector(selector);
+    if (!canvas || canvas.width === 0 || canvas.height === 0) return false;
+    try {
+        const ctx = canvas.getContext('2d');
+        if (!ctx) return true;
+        const points = [[0.25, 0.25], [0.5, 0.5], [0.75, 0.75], [0.25, 0.75], [0.75, 0.25]];
+        return points.some(([x, y]) =>
+            ctx.getImageData(Math.floor(canvas.width * x), Math.floor(canvas.height * y), 1, 1).data[3] !== 0
+        );
+    } catch (e) {
+        // 読み取りできないキャンバスは描画済みとみなす
+        return true;
+    }
+}
+"""
+
+# 一定時間DOMの変更がなければ安定したとみなす（maxMs経過でfalse）
+DOM_STABLE_JS = """
+({ selector, quietMs, maxMs }) => new Promise((resolve) => {
+    const target = (selector && document.querySelector(selector)) || document.body;
+    let quietTimer = null;
+    const finish = (result) => {
+        observer.disconnect();
+        clearTimeout(quietTimer);
+        clearTimeout(maxTimer);
+        resolve(result);
+    };
+    const observer = new MutationObserver(() => {
+        clearTimeout(quietTimer);
+        quietTimer = setTimeout(() => finish(true), quietMs);
+    });
+    observer.observe(target, { childList: true, subtree: true, attributes: true, characterData: true });
+    quietTimer = setTimeout(() => finish(true), quietMs);
+    const maxTimer = setTimeout(() => finish(false), maxMs);
+})
+"""
+
+
+class BrowserPool:
+    """1つのChromiumプロセスを共有し、同時に開くタブ数を制限するプール"""
+
+    def __init__(self, max_concurrency=SCREENSHOT_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._playwright = None
+        self._browser = None
+
+    async def __aenter__(self):
+        started = time.perf_counter()
+        self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch(
+            headless=True,
+            args=['--no-sandbox', '--disable-setuid-sandbox', '--disable-dev-shm-usage']
+        )
+        logger.info(f"Browser launched in {time.perf_counter() - started:.2f}s (max {self.max_concurrency} tabs)")
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._browser:
+            await self._browser.close()
+        if self._playwright:
+            await self._playwright.stop()
+
+    @contextlib.asynccontextmanager
+    async def page(self):
+        """ステルスモードを適用した新しいタブを貸し出す（Cookie等はタブごとに分離）"""
+        async with self._semaphore:
+            context = await self._browser.new_context(
+                viewport={'width': 1920, 'height': 1080}
+            )
+            try:
+                page = await context.new_page()
+                await stealth_async(page)
+                yield page
+            finally:
+                await context.close()
+
+
+class MeteredSession(requests.Session):
+    """受信したバイト数を実行記録の現在のステージに加えるcurl_cffiセッション"""
+
+    def __init__(self, recorder, **kwargs):
+        super().__init__(**kwargs)
+        self.recorder = recorder
+
+    def request(self, method, url, *args, **kwargs):
+        response = super().request(method, url, *args, **kwargs)
+        self.recorder.record_bytes(len(response.content))
+        return response
+
+    # 基底クラスのget等はpartialmethodで基底のrequestに束縛されているため定義し直す
+    head = partialmethod(request, "HEAD")
+    get = partialmethod(request, "GET")
+    post = partialmethod(request, "POST")
+    put = partialmethod(request, "PUT")
+    patch = partialmethod(request, "PATCH")
+    delete = partialmethod(request, "DELETE")
+    options = partialmethod(request, "OPTIONS")
+
+
+CachedPage = collections.namedtuple('CachedPage', ['content', 'changed'])
+
+
+class HttpCache:
+    """ETag・Last-Modifiedを保存し、条件付きリクエストで再取得を省くディスクキャッシュ
+
+    304または内容のハッシュが前回と同じ場合はchanged=Falseを返す。
+    解析結果もページのハッシュと紐づけて保存できる。
+    """
+
+    def __init__(self, session, directory):
+        self.session = session
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f"{key}.json"), os.path.join(self.directory, f"{key}.body")
+
+    def _load_meta(self, url):
+        meta_path, _ = self._paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _save_meta(self, url, meta):
+        meta_path, _ = self._paths(url)
+        atomic_write(meta_path, json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+
+    def get(self, url, timeout=30):
+        """条件付きGETでページを取得し、CachedPageを返す"""
+        meta = self._load_meta(url)
+        _, body_path = self._paths(url)
+        if meta is not None and not os.path.exists(body_path):
+            meta = None
+
+        headers = {}
+        if meta is not None:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        response = self.session.get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and meta is not None:
+            logger.info(f"{url}: 304 Not Modified")
+            with open(body_path, 'rb') as f:
+                return CachedPage(f.read(), False)
+
+        response.raise_for_status()
+        content = response.content
+        digest = hashlib.sha256(content).hexdigest()
+        changed = meta is None or meta.get('sha256') != digest
+        if changed:
+            atomic_write(body_path, content)
+
+        new_meta = {
+            'etag': response.headers.get('etag'),
+            'last_modified': response.headers.get('last-modified'),
+            'sha256': digest,
+            'fetched_at': time.time()
+        }
+        # 内容が同じなら解析結果を引き継ぐ
+        if not changed and meta.get('parsed_sha256') == digest:
+            new_meta['parsed_sha256'] = digest
+            new_meta['parsed'] = meta.get('parsed')
+        self._save_meta(url, new_meta)
+
+        logger.info(f"{url}: {len(content)} bytes downloaded ({'changed' if changed else 'unchanged'})")
+        return CachedPage(content, changed)
+
+    def get_parsed(self, url):
+        """保存中のページに対応する解析結果を返す（なければNone）"""
+        meta = self._load_meta(url)
+        if meta is None or meta.get('parsed_sha256') != meta.get('sha256'):
+            return None
+        return meta.get('parsed')
+
+    def set_parsed(self, url, parsed):
+        """保存中のページに対応する解析結果を保存"""
+        meta = self._load_meta(url)
+        if meta is None:
+            return
+        meta['parsed_sha256'] = meta['sha256']
+        meta['parsed'] = parsed
+        self._save_meta(url, meta)
+
+
+class PromptCache:
+    """モデル・メッセージ・パラメータのハッシュをキーにしたAI応答の永続キャッシュ"""
+
+    def __init__(self, directory, ttl_seconds):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(model, messages, params):
+        payload = json.dumps(
+            {'model': model, 'messages': messages, 'params': params},
+            ensure_ascii=False,
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        """有効期限内の応答を返す（なければNone、期限切れは削除）"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        if time.time() - entry['created_at'] > self.ttl_seconds:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            return None
+        return entry['content']
+
+    def set(self, key, content):
+        entry = {'created_at': time.time(), 'content': content}
+        atomic_write(self._path(key), json.dumps(entry, ensure_ascii=False).encode('utf-8'))
+
+
+class TaskGraph:
+    """依存関係付きの非同期タスクを、依存先がすべて完了した時点で開始する
+
+    依存先は先にaddされている必要がある（循環は作れない）。
+    タスクが失敗しても後続タスクは実行される。
+    """
+
+    def __init__(self):
+        self._tasks = {}
+
+    def add(self, name, func, deps=()):
+        """funcはawaitableを返す呼び出し可能オブジェクト"""
+        unknown = [dep for dep in deps if dep not in self._tasks]
+        if unknown:
+            raise ValueError(f"Task {name} depends on unknown tasks: {unknown}")
+        self._tasks[name] = (func, tuple(deps))
+
+    async def run(self):
+        started = time.perf_counter()
+        futures = {}
+
+        async def run_task(name):
+            func, deps = self._tasks[name]
+            if deps:
+                await asyncio.gather(*(futures[dep] for dep in deps), return_exceptions=True)
+            logger.info(f"Task {name} started at +{time.perf_counter() - started:.2f}s")
+            try:
+                await func()
+            except Exception as e:
+                logger.error(f"Task {name} failed: {e}")
+                raise
+            finally:
+                logger.info(f"Task {name} finished at +{time.perf_counter() - started:.2f}s")
+
+        for name in self._tasks:
+            futures[name] = asyncio.ensure_future(run_task(name))
+        await asyncio.gather(*futures.values(), return_exceptions=True)
+
 
 class MarketDataFetcher:
     def __init__(self):
@@ -31,274 +524,393 @@ class MarketDataFetcher:
             'date': datetime.now(TZ_JST).strftime('%Y-%m-%d'),
             'last_updated': datetime.now(TZ_JST).isoformat(),
             'market': {},
+            'history': {},  # 銘柄ごと・時間足ごとのOHLC（チャート用の分はmarketにも載せる）
             'nasdaq_heatmap': {},
             'sp500_heatmap': {},
             'news': [],
             'indicators': {},
             'column': {},
-            'screenshots': {}  # スクリーンショットデータを格納
+            'screenshots': {}  # スクリーンショットのハッシュ参照を格納
         }
         self.screenshots_dir = os.path.join(DATA_DIR, 'screenshots')
         os.makedirs(self.screenshots_dir, exist_ok=True)
         
+        # ステージごとの所要時間・受信バイト数・再試行回数を記録
+        self.metrics = RunRecorder()
+
         # curl_cffiセッションを作成（HWB-botと同じ方法）
-        self.session = requests.Session(impersonate="safari15_5")
+        self.session = MeteredSession(self.metrics, impersonate="safari15_5")
+
+        # スクリーンショット取得中のみ共有ブラウザと画像エンコード用のプロセスプールを保持
+        self.browser_pool = None
+        self.image_executor = None
+        # 取得元の実行中のみ専用のスレッドプールを保持
+        self.source_executor = None
+
+        # 条件付きリクエストで変更のないページの再取得・再解析を省く
+        self.http_cache = HttpCache(self.session, os.path.join(DATA_DIR, 'http_cache'))
+
+        # 同じ入力でのAI呼び出しは再実行時に再利用する
+        self.prompt_cache = PromptCache(os.path.join(DATA_DIR, 'ai_cache'), AI_CACHE_TTL_SECONDS)
     
-    async def capture_screenshot(self, url, selector=None, wait_time=3000):
-        """指定URLのスクリーンショットをキャプチャ"""
+    def store_screenshot(self, image_bytes, ext='png'):
+        """画像をコンテンツハッシュ名で保存し、ハッシュを返す"""
+        image_hash = hashlib.sha256(image_bytes).hexdigest()
+        path = os.path.join(self.screenshots_dir, f"{image_hash}.{ext}")
+        if os.path.exists(path):
+            # 同一内容の画像は再利用し、保持期間の判定用にmtimeだけ更新
+            os.utime(path)
+        else:
+            atomic_write(path, image_bytes)
+        return image_hash
+
+    async def capture_screenshot(self, url, selector=None, wait_time=3000, readiness=None):
+        """指定URLのスクリーンショットをキャプチャし、保存した画像の参照を返す
+
+        readinessで描画完了の判定方法を指定する（wait_until_readyを参照）。
+        wait_timeは判定が成立しない場合の待機上限として使われる。
+        参照の形式はstore_optimized_screenshotを参照。
+        """
+        started = time.perf_counter()
         try:
-            async with async_playwright() as p:
-                browser = await p.chromium.launch(
-                    headless=True,
-                    args=['--no-sandbox', '--disable-setuid-sandbox', '--disable-dev-shm-usage']
-                )
-                page = await browser.new_page(
-                    viewport={'width': 1920, 'height': 1080}
-                )
-                
-                # ステルスモードを適用
-                await stealth_async(page)
+            if self.browser_pool is None:
+                # 単発呼び出し用に一時的なブラウザを起動
+                async with BrowserPool(max_concurrency=1) as pool:
+                    screenshot = await self._capture_page(pool, url, selector, wait_time, readiness)
+            else:
+                screenshot = await self._capture_page(self.browser_pool, url, selector, wait_time, readiness)
+
+            logger.info(f"Captured {url} in {time.perf_counter() - started:.2f}s")
+            self.metrics.record_bytes(len(screenshot))
+            return await self.store_optimized_screenshot(url, screenshot)
 
-                # ページを読み込み
-                await page.goto(url, wait_until='domcontentloaded', timeout=30000)
-                await page.wait_for_timeout(wait_time)  # 追加の待機時間
-                
-                # 特定の要素を指定してスクリーンショット
-                if selector:
-                    try:
-                        element = page.locator(selector).first
-                        await element.wait_for(state='visible', timeout=10000)
-                        screenshot = await element.screenshot()
-                    except Exception as e:
-                        logger.warning(f"Selector {selector} not found: {e}, taking full page screenshot")
-                        screenshot = await page.screenshot(full_page=False)
-                else:
-                    screenshot = await page.screenshot(full_page=False)
-                
-                await browser.close()
-                
-                # Base64エンコード
-                screenshot_base64 = base64.b64encode(screenshot).decode('utf-8')
-                return screenshot_base64
-                
         except Exception as e:
-            logger.error(f"Error capturing screenshot from {url}: {e}")
+            logger.error(f"Error capturing screenshot from {url} after {time.perf_counter() - started:.2f}s: {e}")
+            self.metrics.fail(str(e))
             return None
-    
-    async def fetch_fear_greed_screenshot(self):
-        """Fear & Greed Indexのスクリーンショットを取得"""
+
+    async def store_optimized_screenshot(self, url, png_bytes):
+        """撮影したPNGをサイズ・形式ごとに再エンコードして保存し、画像の参照を返す
+
+        参照は {'width', 'height', 'sizes': [{'name', 'width', 'height', 'webp', 'png'[, 'avif']}]}
+        の形式で、sizesは幅の小さい順、各形式の値は保存した画像のハッシュ。
+        再エンコードに失敗した場合は元のPNGを保存し、そのハッシュ（旧形式）を返す。
+        """
+        started = time.perf_counter()
         try:
-            logger.info("Capturing Fear & Greed Index screenshot...")
-            screenshot = await self.capture_screenshot(
-                'https://edition.cnn.com/markets/fear-and-greed',
-                "div[data-uri*='fearandgreed']",  # Fear & Greedゲージのセレクター
-                wait_time=5000
+            # CPUを使う処理のため、イベントループを止めないよう別プロセスで行う
+            loop = asyncio.get_running_loop()
+            optimized = await loop.run_in_executor(
+                self.image_executor,
+                optimize_screenshot,
+                png_bytes,
+                SCREENSHOT_SIZES,
+                SCREENSHOT_WEBP_QUALITY,
+                SCREENSHOT_AVIF_QUALITY
             )
-            
-            if screenshot:
-                self.data['screenshots']['fear_greed'] = screenshot
-                logger.info("Fear & Greed Index screenshot captured")
-            
         except Exception as e:
-            logger.error(f"Error fetching Fear & Greed screenshot: {e}")
-    
-    async def fetch_finviz_heatmaps(self):
-        """FinvizからS&P500とNASDAQ100のヒートマップスクリーンショットを取得"""
-        heatmap_configs = {
-            'sp500': {
-                'day': 'https://finviz.com/map.ashx?t=sec',
-                'week': 'https://finviz.com/map.ashx?t=sec&st=w1',
-                'month': 'https://finviz.com/map.ashx?t=sec&st=w4'
-            },
-            'nasdaq100': {
-                'day': 'https://finviz.com/map.ashx?t=sec_ndx',
-                'week': 'https://finviz.com/map.ashx?t=sec_ndx&st=w1',
-                'month': 'https://finviz.com/map.ashx?t=sec_ndx&st=w4'
-            }
-        }
-        
-        for index_name, periods in heatmap_configs.items():
-            self.data['screenshots'][index_name] = {}
-            
-            for period, url in periods.items():
+            logger.error(f"Error optimizing screenshot from {url}, storing original PNG: {e}")
+            return self.store_screenshot(png_bytes)
+
+        ref = {'width': optimized['width'], 'height': optimized['height'], 'sizes': []}
+        for variant in optimized['sizes']:
+            entry = {'name': variant['name'], 'width': variant['width'], 'height': variant['height']}
+            for fmt, image_bytes in variant['encoded'].items():
+                entry[fmt] = self.store_screenshot(image_bytes, fmt)
+            ref['sizes'].append(entry)
+
+        # 元のPNGに対する削減量を記録
+        original = len(png_bytes)
+        summary = ', '.join(
+            f"{variant['name']} {variant['width']}px "
+            + '/'.join(f"{fmt} {len(data) / 1024:.0f}KB" for fmt, data in variant['encoded'].items())
+            for variant in optimized['sizes']
+        )
+        largest_webp = len(optimized['sizes'][-1]['encoded']['webp'])
+        smallest_webp = len(optimized['sizes'][0]['encoded']['webp'])
+        logger.info(
+            f"Optimized {url} in {time.perf_counter() - started:.2f}s: PNG {original / 1024:.0f}KB -> {summary} "
+            f"(largest WebP -{1 - largest_webp / original:.0%}, smallest WebP -{1 - smallest_webp / original:.0%})"
+        )
+        return ref
+
+    async def _capture_page(self, pool, url, selector, wait_time, readiness):
+        """プールのタブでページを開き、PNGのバイト列を返す"""
+        async with pool.page() as page:
+            # ページを読み込み
+            await page.goto(url, wait_until='domcontentloaded', timeout=30000)
+            await self.wait_until_ready(page, url, readiness, wait_time)
+
+            # 特定の要素を指定してスクリーンショット
+            if selector:
                 try:
-                    logger.info(f"Capturing {index_name} {period} heatmap...")
-                    screenshot = await self.capture_screenshot(
-                        url,
-                        '#content',  # Finvizのメインコンテンツエリア
-                        wait_time=5000
-                    )
-                    
-                    if screenshot:
-                        self.data['screenshots'][index_name][period] = screenshot
-                        logger.info(f"{index_name} {period} heatmap captured")
-                        
+                    element = page.locator(selector).first
+                    await element.wait_for(state='visible', timeout=10000)
+                    return await element.screenshot()
                 except Exception as e:
-                    logger.error(f"Error capturing {index_name} {period} heatmap: {e}")
+                    logger.warning(f"Selector {selector} not found: {e}, taking full page screenshot")
+            return await page.screenshot(full_page=False)
     
-    def fetch_vix_data(self):
-        """VIXデータを取得（curl_cffiセッション使用）"""
+    async def wait_until_ready(self, page, url, readiness, ceiling_ms):
+        """ページの描画完了を待機し、準備完了までの時間(ms)を返す
+
+        readinessのstrategy:
+            fixed       -- ceiling_msだけ待機する（従来の動作）
+            selector    -- selectorの要素が表示されるまで
+            canvas      -- selector配下のキャンバスが描画されるまで
+            networkidle -- ネットワーク通信が落ち着くまで
+            dom_stable  -- selector配下のDOMがquiet_ms変化しなくなるまで
+        いずれもceiling_msを上限とし、超えた場合はそのまま撮影に進む。
+        """
+        readiness = readiness or {'strategy': 'fixed'}
+        strategy = readiness.get('strategy', 'fixed')
+        selector = readiness.get('selector')
+        if strategy not in READINESS_STRATEGIES:
+            raise ValueError(f"Unknown readiness strategy: {strategy}")
+
+        started = time.perf_counter()
+        ready = True
+
         try:
-            ticker = yf.Ticker("VX=F", session=self.session)
-            
-            # 過去5日分の1時間足データを取得
-            hist = ticker.history(period="5d", interval="1h")
+            if strategy == 'fixed':
+                await page.wait_for_timeout(ceiling_ms)
+            elif strategy == 'selector':
+                await page.locator(selector).first.wait_for(state='visible', timeout=ceiling_ms)
+            elif strategy == 'canvas':
+                await page.wait_for_function(CANVAS_PAINTED_JS, arg=selector, timeout=ceiling_ms, polling=100)
+            elif strategy == 'networkidle':
+                await page.wait_for_load_state('networkidle', timeout=ceiling_ms)
+            elif strategy == 'dom_stable':
+                ready = await page.evaluate(DOM_STABLE_JS, {
+                    'selector': selector,
+                    'quietMs': readiness.get('quiet_ms', 500),
+                    'maxMs': ceiling_ms
+                })
+        except Exception as e:
+            ready = False
+            logger.debug(f"Readiness wait for {url} ended: {e}")
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if ready:
+            logger.info(f"Ready ({strategy}) in {elapsed_ms:.0f}ms: {url}")
+        else:
+            logger.warning(f"Not ready ({strategy}) after {elapsed_ms:.0f}ms (ceiling {ceiling_ms}ms), capturing anyway: {url}")
+        return elapsed_ms
+
+    def fetch_fear_greed_data(self, data=None):
+        """CNNのgraphdata（JSON）からFear & Greed Indexの現在値・履歴・構成指標を取得
+
+        dataには結果の格納先を渡す（省略時はself.data）。
+        """
+        data = self.data if data is None else data
+        try:
+            start = (datetime.now(TZ_JST) - timedelta(days=FEAR_GREED_HISTORY_DAYS)).strftime('%Y-%m-%d')
+            response = self.session.get(
+                f"{CNN_FEAR_GREED_URL}{start}",
+                headers={'Referer': 'https://edition.cnn.com/', 'Origin': 'https://edition.cnn.com'},
+                timeout=20
+            )
+            response.raise_for_status()
+
+            fear_greed = parse_fear_greed(response.json())
+            data.setdefault('market', {})['fear_greed'] = fear_greed
+            logger.info(
+                f"Fear & Greed fetched: {fear_greed['score']} ({fear_greed['rating']}), "
+                f"{len(fear_greed['history']['time'])} history points"
+            )
 
-            if hist.empty: 
-                logger.error("VIX data is empty.")
-                self.data['market']['vix'] = {'error': 'No data received from yfinance'}
-                return
-            
-            # 4時間足にリサンプリング
-            hist.index = pd.to_datetime(hist.index)
-            agg_rules = {
-                'Open': 'first',
-                'High': 'max',
-                'Low': 'min',
-                'Close': 'last'
-            }
-            four_hour_hist = hist.resample('4H', label='left', closed='left').agg(agg_rules).dropna()
-
-            four_hour_data = [
-                {
-                    'time': index.isoformat(),
-                    'open': float(row['Open']),
-                    'high': float(row['High']),
-                    'low': float(row['Low']),
-                    'close': float(row['Close'])
-                }
-                for index, row in four_hour_hist.iterrows()
-            ]
-            
-            self.data['market']['vix'] = {
-                'current': float(hist['Close'].iloc[-1]),
-                'history': four_hour_data
-            }
-            logger.info(f"VIX data fetched: {self.data['market']['vix']['current']}")
-            
         except Exception as e:
-            logger.error(f"Error fetching VIX data: {e}")
-            self.data['market']['vix'] = {'error': str(e)}
+            logger.error(f"Error fetching Fear & Greed data: {e}")
+            data.setdefault('market', {})['fear_greed'] = {'error': str(e)}
+            self.metrics.fail(str(e))
+
+    def has_fear_greed_data(self):
+        return self.data['market'].get('fear_greed', {}).get('score') is not None
+
+    async def fetch_fear_greed_screenshot(self, fear_greed_done=None):
+        """Fear & Greed Indexのスクリーンショットを取得（JSONで取得できなかった場合の代替）
+
+        fear_greed_doneにはJSONの取得完了を知らせるEventを渡す（並行して取得中の場合）。
+        """
+        if fear_greed_done is not None:
+            await fear_greed_done.wait()
+        if self.has_fear_greed_data():
+            logger.info("Fear & Greed data available, skipping screenshot")
+            return
+
+        with self.metrics.stage('screenshot_fear_greed'):
+            try:
+                logger.info("Capturing Fear & Greed Index screenshot...")
+                screenshot = await self.capture_screenshot(
+                    CNN_FEAR_GREED_PAGE_URL,
+                    "div[data-uri*='fearandgreed']",  # Fear & Greedゲージのセレクター
+                    wait_time=5000,
+                    # ゲージはJSで描画されるため、DOMが落ち着くまで待つ
+                    readiness={'strategy': 'dom_stable', 'selector': "div[data-uri*='fearandgreed']", 'quiet_ms': 500}
+                )
+
+                if screenshot:
+                    self.data['screenshots']['fear_greed'] = screenshot
+                    logger.info("Fear & Greed Index screenshot captured")
+
+            except Exception as e:
+                logger.error(f"Error fetching Fear & Greed screenshot: {e}")
+                self.metrics.fail(str(e))
     
-    def fetch_t_note_future(self):
-        """米国10年債先物（ZN=F）のデータを取得"""
-        try:
-            ticker = yf.Ticker("ZN=F", session=self.session)
-            hist = ticker.history(period="5d", interval="1h")
+    async def fetch_finviz_heatmaps(self):
+        """FinvizからS&P500とNASDAQ100のヒートマップスクリーンショットを取得"""
+        for index_name in FINVIZ_HEATMAP_URLS:
+            self.data['screenshots'][index_name] = {}
+
+        # 全期間・全指数のヒートマップを並列で取得
+        await asyncio.gather(*[
+            self.fetch_finviz_heatmap(index_name, period, url)
+            for index_name, periods in FINVIZ_HEATMAP_URLS.items()
+            for period, url in periods.items()
+        ])
+
+    async def fetch_finviz_heatmap(self, index_name, period, url):
+        """Finvizのヒートマップを1枚取得"""
+        with self.metrics.stage(f"heatmap_{index_name}_{period}"):
+            try:
+                logger.info(f"Capturing {index_name} {period} heatmap...")
+                screenshot = await self.capture_screenshot(
+                    url,
+                    '#content',  # Finvizのメインコンテンツエリア
+                    wait_time=5000,
+                    # ヒートマップはcanvasに描画される
+                    readiness={'strategy': 'canvas', 'selector': '#content canvas'}
+                )
 
+                if screenshot:
+                    self.data['screenshots'][index_name][period] = screenshot
+                    logger.info(f"{index_name} {period} heatmap captured")
+
+            except Exception as e:
+                logger.error(f"Error capturing {index_name} {period} heatmap: {e}")
+                self.metrics.fail(str(e))
+    
+    def fetch_market_data(self, names=None, data=None):
+        """登録銘柄（MARKET_INSTRUMENTS）の1時間足を差分取得し、銘柄ごとに格納
+
+        dataには結果の格納先を渡す（省略時はself.data）。
+        """
+        data = self.data if data is None else data
+        names = list(names or MARKET_INSTRUMENTS)
+        symbols = [MARKET_INSTRUMENTS[name] for name in names]
+        store = OHLCStore(OHLC_DB_PATH)
+        errors = {}
+
+        # 保存済みの銘柄は最新バー以降のみ、未保存の銘柄は初回分をまとめて取得
+        last_times = {symbol: store.last_timestamp(symbol) for symbol in symbols}
+        stored = [symbol for symbol in symbols if last_times[symbol] is not None]
+        missing = [symbol for symbol in symbols if last_times[symbol] is None]
+        batches = []
+        if stored:
+            # 最新バーは確定前の可能性があるため、そのバーから取り直す
+            batches.append((stored, {'start': min(last_times[symbol] for symbol in stored)}))
+        if missing:
+            batches.append((missing, {'period': OHLC_INITIAL_PERIOD}))
+
+        for batch, window in batches:
+            try:
+                # yfinanceの並列ダウンロード用スレッドの受信量もこのステージに計上する
+                with self.metrics.untracked_stage(self.metrics.current()):
+                    frames = yf.download(
+                        batch,
+                        interval="1h",
+                        group_by='ticker',
+                        session=self.session,
+                        threads=True,
+                        progress=False,
+                        **window
+                    )
+                for symbol in batch:
+                    count = store.upsert(symbol, extract_ticker_frame(frames, symbol))
+                    logger.info(f"{symbol}: {count} bars stored")
+            except Exception as e:
+                logger.error(f"Error downloading market data for {batch}: {e}")
+                errors.update({symbol: str(e) for symbol in batch})
+                self.metrics.fail(str(e))
+
+        since = time.time() - max(OHLC_HISTORY_DAYS.values()) * 24 * 60 * 60
+        for name, symbol in zip(names, symbols):
+            self.store_instrument(data, name, symbol, store.load(symbol, since=since), errors.get(symbol))
+
+    def store_instrument(self, data, name, symbol, hist, error=None):
+        """保存済みの1時間足から1銘柄分のデータを時間足ごとにdataへ格納"""
+        market = data.setdefault('market', {})
+        try:
             if hist.empty:
-                logger.error("T-Note future data is empty.")
-                self.data['market']['t_note_future'] = {'error': 'No data received from yfinance'}
+                logger.error(f"{name} ({symbol}) data is empty.")
+                market[name] = {'error': error or 'No data received from yfinance'}
                 return
-            
-            # 4時間足にリサンプリング
-            hist.index = pd.to_datetime(hist.index)
-            agg_rules = {
-                'Open': 'first',
-                'High': 'max',
-                'Low': 'min',
-                'Close': 'last'
-            }
-            four_hour_hist = hist.resample('4H', label='left', closed='left').agg(agg_rules).dropna()
-
-            four_hour_data = [
-                {
-                    'time': index.isoformat(),
-                    'open': float(row['Open']),
-                    'high': float(row['High']),
-                    'low': float(row['Low']),
-                    'close': float(row['Close'])
-                }
-                for index, row in four_hour_hist.iterrows()
-            ]
 
-            self.data['market']['t_note_future'] = {
-                'current': float(hist['Close'].iloc[-1]),
-                'history': four_hour_data
-            }
-            logger.info(f"T-Note future fetched: {self.data['market']['t_note_future']['current']}")
+            # 日足の区切りを米国東部時間に合わせる
+            hist.index = hist.index.tz_convert(TZ_US_EASTERN)
+
+            history = build_ohlc_history(hist)
+            data.setdefault('history', {})[name] = history
+            market[name] = {'current': float(hist['Close'].dropna().iloc[-1])}
+            # 初回表示のmarketセクションを小さく保つため、チャートに使う分だけ載せる
+            if name in MARKET_CHART_INSTRUMENTS:
+                market[name]['history'] = {
+                    OHLC_CHART_TIMEFRAME: tail_columns(history[OHLC_CHART_TIMEFRAME], OHLC_CHART_DAYS)
+                }
+            logger.info(f"{name} ({symbol}) fetched: {market[name]['current']}")
 
         except Exception as e:
-            logger.error(f"Error fetching T-Note future: {e}")
-            self.data['market']['t_note_future'] = {'error': str(e)}
+            logger.error(f"Error processing {name} ({symbol}) data: {e}")
+            market[name] = {'error': str(e)}
+
+    def fetch_vix_data(self):
+        """VIXデータを取得（curl_cffiセッション使用）"""
+        self.fetch_market_data(['vix'])
+
+    def fetch_t_note_future(self):
+        """米国10年債先物（ZN=F）のデータを取得"""
+        self.fetch_market_data(['t_note_future'])
     
-    def fetch_economic_indicators(self):
-        """経済指標カレンダーをみんかぶから取得"""
+    def fetch_economic_indicators(self, data=None):
+        """経済指標カレンダーをみんかぶから取得（dataには結果の格納先を渡す、省略時はself.data）"""
+        data = self.data if data is None else data
         try:
-            response = self.session.get(MINKABU_INDICATORS_URL, timeout=30)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.content, 'lxml')
-            
-            indicators = []
-            
-            # 日付ごとにテーブルを処理
-            tables = soup.find_all('table', class_='tbl-border')
-            
-            for table in tables:
-                caption = table.find('caption')
-                date = caption.text.strip() if caption else ''
-
-                rows = table.find_all('tr', attrs={'data_importance': True})
-
-                for row in rows:
-                    importance = int(row['data_importance'])
-
-                    # 重要度3以上のみ表示
-                    if importance >= 3:
-                        cols = row.find_all('td')
-
-                        time = cols[0].text.strip()
-                        country = row['data_country']
-                        name = cols[2].text.strip()
-                        
-                        # 前回ドル円変動幅
-                        fluctuation_span = cols[4].find('span')
-                        previous_fluctuation = fluctuation_span.text.strip() if fluctuation_span else '---'
-
-                        # 前回・予想・結果
-                        previous_value = cols[5].text.strip()
-                        forecast = cols[6].text.strip()
-                        result = cols[7].text.strip()
-
-                        indicators.append({
-                            'date': date,
-                            'time': time,
-                            'country': country,
-                            'name': name,
-                            'importance': importance,
-                            'previous_fluctuation': previous_fluctuation,
-                            'previous_value': previous_value,
-                            'forecast': forecast,
-                            'result': result
-                        })
-            
-            self.data['indicators']['economic'] = indicators
+            page = self.http_cache.get(MINKABU_INDICATORS_URL, timeout=30)
+
+            # ページが変わっていなければ前回の解析結果を再利用
+            indicators = None if page.changed else self.http_cache.get_parsed(MINKABU_INDICATORS_URL)
+            if indicators is None:
+                indicators = parse_economic_indicators(page.content)
+                self.http_cache.set_parsed(MINKABU_INDICATORS_URL, indicators)
+            else:
+                logger.info("Economic calendar unchanged, reusing parsed indicators")
+
+            data.setdefault('indicators', {})['economic'] = indicators
             logger.info(f"Economic indicators fetched: {len(indicators)} items")
             
         except Exception as e:
             logger.error(f"Error fetching economic indicators: {e}")
-            self.data['indicators']['economic'] = []
+            data.setdefault('indicators', {})['economic'] = []
+            self.metrics.fail(str(e))
     
-    def fetch_news(self):
-        """最新の米国株関連ニュースを取得（curl_cffiセッション使用）"""
+    def fetch_news(self, data=None):
+        """最新の米国株関連ニュースを取得（curl_cffiセッション使用）
+
+        dataには結果の格納先を渡す（省略時はself.data）。
+        """
+        data = self.data if data is None else data
         try:
             # Yahoo Financeからニュースを取得
             tickers = ['^GSPC', '^IXIC', '^DJI']  # S&P 500, NASDAQ, DOW
-            news_items = []
-            
-            for ticker_symbol in tickers:
-                # curl_cffiセッションを使用
-                ticker = yf.Ticker(ticker_symbol, session=self.session)
-                news = ticker.news
-                
-                if news:  # newsが空でないかチェック
-                    for item in news[:3]:  # 各インデックスから上位3件
-                        news_items.append({
-                            'title': item.get('title', ''),
-                            'publisher': item.get('publisher', ''),
-                            'link': item.get('link', ''),
-                            'published': datetime.fromtimestamp(item.get('providerPublishTime', 0)).isoformat()
-                        })
+
+            # 指数ごとのニュースを並列で取得（結果の順序はtickersの順）
+            # 受信量を現在のステージに計上するため、各スレッドにcontextを引き継ぐ
+            with ThreadPoolExecutor(max_workers=len(tickers)) as executor:
+                futures = [
+                    executor.submit(contextvars.copy_context().run, self.fetch_ticker_news, ticker)
+                    for ticker in tickers
+                ]
+                news_items = [item for future in futures for item in future.result()]
             
             # 重複を除去
             seen = set()
@@ -308,14 +920,73 @@ class MarketDataFetcher:
                     seen.add(item['title'])
                     unique_news.append(item)
             
-            self.data['news'] = unique_news[:5]  # 上位5件
-            logger.info(f"News fetched: {len(self.data['news'])} items")
+            data['news'] = unique_news[:5]  # 上位5件
+            logger.info(f"News fetched: {len(data['news'])} items")
             
         except Exception as e:
             logger.error(f"Error fetching news: {e}")
-            self.data['news'] = []
+            data['news'] = []
+            self.metrics.fail(str(e))
     
-    def generate_ai_commentary(self):
+    def fetch_ticker_news(self, ticker_symbol):
+        """1つの指数のニュース上位3件を取得"""
+        # curl_cffiセッションを使用
+        ticker = yf.Ticker(ticker_symbol, session=self.session)
+        news = ticker.news
+
+        if not news:  # newsが空でないかチェック
+            return []
+
+        return [
+            {
+                'title': item.get('title', ''),
+                'publisher': item.get('publisher', ''),
+                'link': item.get('link', ''),
+                'published': datetime.fromtimestamp(item.get('providerPublishTime', 0)).isoformat()
+            }
+            for item in news[:3]  # 各インデックスから上位3件
+        ]
+
+    async def chat_completion(self, label, messages, **params):
+        """キャッシュと回数制限付きのリトライでChat Completionsを呼び出し、応答本文を返す"""
+        with self.metrics.stage(f"ai_{label}"):
+            started = time.perf_counter()
+            key = PromptCache.make_key(OPENAI_MODEL, messages, params)
+            cached = self.prompt_cache.get(key)
+            # 以前に保存された空の応答は使わない
+            if cached:
+                logger.info(f"AI {label}: cache hit ({(time.perf_counter() - started) * 1000:.0f}ms)")
+                return cached
+
+            for attempt in range(1, OPENAI_MAX_ATTEMPTS + 1):
+                try:
+                    response = await client.chat.completions.create(
+                        model=OPENAI_MODEL,
+                        messages=messages,
+                        **params
+                    )
+                    # 推論モデルはトークン上限に達すると空の本文を返すため、完了した応答のみ使う
+                    choice = response.choices[0]
+                    content = choice.message.content
+                    if choice.finish_reason != 'stop' or not content:
+                        raise IncompleteCompletionError(
+                            f"finish_reason={choice.finish_reason}, {len(content or '')} chars"
+                        )
+                    break
+                except RETRYABLE_OPENAI_ERRORS as e:
+                    if attempt == OPENAI_MAX_ATTEMPTS:
+                        raise
+                    delay = 2 ** (attempt - 1)
+                    self.metrics.record_retry()
+                    logger.warning(f"AI {label}: attempt {attempt} failed ({e}), retrying in {delay}s")
+                    await asyncio.sleep(delay)
+
+            self.metrics.record_bytes(len(content.encode('utf-8')))
+            self.prompt_cache.set(key, content)
+            logger.info(f"AI {label}: cache miss, generated in {time.perf_counter() - started:.2f}s")
+            return content
+
+    async def generate_ai_commentary(self):
         """AIによる市況解説を生成（max_completion_tokens使用）"""
         try:
             # VIXと10年債先物のデータからプロンプトを構築
@@ -343,31 +1014,33 @@ class MarketDataFetcher:
             3. 今後の見通し
             """
             
-            response = client.chat.completions.create(
-                model=OPENAI_MODEL,
-                messages=[
+            self.data['market']['ai_commentary'] = await self.chat_completion(
+                'commentary',
+                [
                     {"role": "system", "content": "あなたは金融市場の専門家です。初心者にもわかりやすく、かつ的確な市場解説を提供してください。"},
                     {"role": "user", "content": prompt}
                 ],
                 max_completion_tokens=500,  # max_tokensの代わりにmax_completion_tokensを使用
                 temperature=0.8
             )
-            
-            self.data['market']['ai_commentary'] = response.choices[0].message.content
             logger.info("AI commentary generated")
             
         except Exception as e:
             logger.error(f"Error generating AI commentary: {e}")
             self.data['market']['ai_commentary'] = "市況解説の生成に失敗しました。"
     
-    def generate_ai_column(self):
-        """AIによる週次コラムを生成（max_completion_tokens使用）"""
+    async def generate_ai_column(self, weekly=None):
+        """AIによる週次コラムを生成（max_completion_tokens使用）
+
+        weeklyには週次レポートを作るかを渡す（スケジューラーは米国の週の最後の
+        取引日の引け後に作る）。省略時は日本時間の月曜日の実行で作る。
+        """
         try:
-            # 週次レポート（月曜日更新）
             today = datetime.now(TZ_JST)
-            is_monday = today.weekday() == 0
+            if weekly is None:
+                weekly = today.weekday() == 0
             
-            if is_monday:
+            if weekly:
                 prompt = """
                 今週の米国株市場の注目ポイントについて、個人投資家向けに週次レポートを作成してください。
                 以下の項目を含めてください：
@@ -379,9 +1052,9 @@ class MarketDataFetcher:
                 300文字程度でまとめてください。
                 """
                 
-                response = client.chat.completions.create(
-                    model=OPENAI_MODEL,
-                    messages=[
+                content = await self.chat_completion(
+                    'column',
+                    [
                         {"role": "system", "content": "あなたは経験豊富な投資アドバイザーです。"},
                         {"role": "user", "content": prompt}
                     ],
@@ -391,7 +1064,7 @@ class MarketDataFetcher:
                 
                 self.data['column']['weekly_report'] = {
                     'title': '今週の注目ポイント',
-                    'content': response.choices[0].message.content,
+                    'content': content,
                     'date': today.strftime('%Y-%m-%d')
                 }
             
@@ -404,8 +1077,7 @@ class MarketDataFetcher:
         """Saves intermediate data to a JSON file."""
         raw_data_path = os.path.join(DATA_DIR, 'data_raw.json')
         try:
-            with open(raw_data_path, 'w', encoding='utf-8') as f:
-                json.dump(self.data, f, ensure_ascii=False, indent=2)
+            atomic_write(raw_data_path, serialize_json(self.data))
             logger.info(f"Raw data saved to {raw_data_path}")
         except Exception as e:
             logger.error(f"Error saving raw data: {e}")
@@ -421,70 +1093,307 @@ class MarketDataFetcher:
             logger.error(f"Error loading raw data: {e}")
             raise
 
-    def save_data(self):
-        """データをJSON形式で保存"""
+        # fetch時の実行記録を引き継ぐ
         try:
-            filename = f"{DATA_DIR}/data_{self.data['date']}.json"
-            with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(self.data, f, ensure_ascii=False, indent=2)
-            logger.info(f"Data saved to {filename}")
-            
-            # 1週間前のデータを削除
-            week_ago = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
-            old_file = f"{DATA_DIR}/data_{week_ago}.json"
-            if os.path.exists(old_file):
-                os.remove(old_file)
-                logger.info(f"Old data file removed: {old_file}")
-                
+            with open(os.path.join(DATA_DIR, RAW_RUN_RECORD_FILE), 'r', encoding='utf-8') as f:
+                self.metrics.merge(json.load(f))
+        except FileNotFoundError:
+            pass
         except Exception as e:
-            logger.error(f"Error saving data: {e}")
-    
-    async def fetch_all_async(self):
-        """非同期でスクリーンショットを取得"""
-        logger.info("Starting screenshot capture...")
-        
-        # スクリーンショット取得タスク
-        tasks = [
-            self.fetch_fear_greed_screenshot(),
-            self.fetch_finviz_heatmaps()
-        ]
-        
-        await asyncio.gather(*tasks)
-        logger.info("Screenshot capture completed")
+            logger.error(f"Error loading raw run record: {e}")
+
+    def save_run_record(self, filename):
+        """ステージごとの計測値をデータファイルと同じディレクトリに保存"""
+        path = os.path.join(DATA_DIR, filename)
+        try:
+            record = self.metrics.to_dict()
+            atomic_write(path, json.dumps(record, ensure_ascii=False, indent=2).encode('utf-8'))
+            summary = ', '.join(f"{stage['name']}={stage['duration_seconds']}s" for stage in record['stages'])
+            logger.info(f"Run record saved to {path} ({record['status']} in {record['duration_seconds']}s: {summary})")
+        except Exception as e:
+            logger.error(f"Error saving run record: {e}")
+
+    def save_data(self):
+        """データをJSON形式で保存し、latest.jsonを更新"""
+        with self.metrics.stage('save'):
+            try:
+                body = serialize_json(self.data)
+                filename = os.path.join(DATA_DIR, snapshot_filename(self.data['date']))
+
+                # 圧縮版を先に用意してから本体とマニフェストを置き換える
+                encodings = ['gzip']
+                atomic_write(filename + PRECOMPRESSED_SUFFIXES['gzip'], gzip.compress(body, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    atomic_write(filename + PRECOMPRESSED_SUFFIXES['br'], brotli.compress(body))
+                    encodings.append('br')
+                atomic_write(filename, body)
+
+                manifest = {
+                    'file': os.path.basename(filename),
+                    'date': self.data['date'],
+                    'last_updated': self.data['last_updated'],
+                    'version': content_version(body),
+                    'size': len(body),
+                    'encodings': encodings
+                }
+                atomic_write(os.path.join(DATA_DIR, LATEST_MANIFEST_FILE), json.dumps(manifest).encode('utf-8'))
+                logger.info(f"Data saved to {filename} ({len(body)} bytes)")
+
+                self.remove_old_data()
+                self.remove_old_screenshots()
+
+            except Exception as e:
+                logger.error(f"Error saving data: {e}")
+
+    def remove_old_data(self, days=DATA_RETENTION_DAYS):
+        """保持期間を過ぎたデータファイルを削除"""
+        cutoff = (datetime.now(TZ_JST) - timedelta(days=days)).strftime('%Y-%m-%d')
+        for name in os.listdir(DATA_DIR):
+            match = RETAINED_FILE_PATTERN.match(name)
+            if match and match.group(1) <= cutoff:
+                os.remove(os.path.join(DATA_DIR, name))
+                logger.info(f"Old data file removed: {name}")
+
+    def remove_old_screenshots(self, days=DATA_RETENTION_DAYS):
+        """一定期間参照されていないスクリーンショットを削除"""
+        cutoff = time.time() - days * 24 * 60 * 60
+        for name in os.listdir(self.screenshots_dir):
+            path = os.path.join(self.screenshots_dir, name)
+            if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                logger.info(f"Old screenshot removed: {path}")
+
+    async def fetch_all_async(self, fear_greed_done=None):
+        """非同期でスクリーンショットを取得
+
+        Fear & Greed IndexはJSONで取得できなかった場合のみ撮影する。
+        """
+        with self.metrics.stage('screenshots'):
+            logger.info("Starting screenshot capture...")
+            started = time.perf_counter()
+
+            # 全キャプチャで1つのブラウザを共有する
+            async with BrowserPool(SCREENSHOT_CONCURRENCY) as pool:
+                self.browser_pool = pool
+                # ワーカーはforkせずに起動する（ブラウザ制御のスレッドを複製しないため）
+                self.image_executor = ProcessPoolExecutor(
+                    max_workers=SCREENSHOT_ENCODE_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                try:
+                    # スクリーンショット取得タスク
+                    tasks = [
+                        self.fetch_fear_greed_screenshot(fear_greed_done),
+                        self.fetch_finviz_heatmaps()
+                    ]
+
+                    await asyncio.gather(*tasks)
+                finally:
+                    self.browser_pool = None
+                    executor, self.image_executor = self.image_executor, None
+                    await asyncio.to_thread(executor.shutdown)
+
+            logger.info(f"Screenshot capture completed in {time.perf_counter() - started:.2f}s")
+
+    def mark_source_failed(self, source, error):
+        """取得元が失敗・タイムアウトした場合のエラー値を格納"""
+        if source == 'market':
+            for name in MARKET_INSTRUMENTS:
+                self.data['market'][name] = {'error': error}
+        elif source == 'indicators':
+            self.data['indicators']['economic'] = []
+        elif source == 'news':
+            self.data['news'] = []
+        elif source == 'fear_greed':
+            self.data['market']['fear_greed'] = {'error': error}
+
+    @contextlib.contextmanager
+    def running_sources(self):
+        """取得元を実行するスレッドプールを用意する
+
+        タイムアウトした取得処理のスレッドは止められないため、閉じる際に終了を待たない
+        （既定のexecutorだとasyncio.runの終了時に待たされる）。
+        """
+        self.source_executor = ThreadPoolExecutor(
+            max_workers=len(FETCH_SOURCE_TIMEOUTS),
+            thread_name_prefix='source'
+        )
+        try:
+            yield
+        finally:
+            executor, self.source_executor = self.source_executor, None
+            executor.shutdown(wait=False)
+
+    def merge_source_result(self, result):
+        """取得元ごとの結果をself.dataに反映"""
+        for key, value in result.items():
+            if isinstance(value, dict):
+                self.data.setdefault(key, {}).update(value)
+            else:
+                self.data[key] = value
+
+    async def run_source(self, source, func, keep_published=False):
+        """ブロッキングな取得処理をスレッドで実行（取得元ごとのタイムアウト付き）
+
+        取得処理は取得元ごとの辞書に結果を書き込み、期限内に終わった場合だけself.dataに反映する。
+        タイムアウト後も動き続けるスレッドがself.dataを書き換えることはない。
+        keep_published=Trueの場合（公開済みデータの更新）は、失敗した分のエラー値を書き込まず
+        読み込んだ値を残す。
+        """
+        timeout = FETCH_SOURCE_TIMEOUTS[source]
+        started = time.perf_counter()
+        result = {}
+        with self.metrics.stage(source) as stage:
+            try:
+                # 受信量をこのステージに計上するため、スレッドにcontextを引き継ぐ
+                # （fetch_market_dataの第1引数は銘柄名なので、格納先は必ずキーワードで渡す）
+                call = partial(contextvars.copy_context().run, func, data=result)
+                await asyncio.wait_for(asyncio.get_running_loop().run_in_executor(self.source_executor, call), timeout)
+                self.merge_source_result(successful_entries(result) if keep_published else result)
+                logger.info(f"Source {source} finished in {time.perf_counter() - started:.2f}s")
+            except asyncio.TimeoutError:
+                logger.error(f"Source {source} timed out after {timeout}s")
+                if not keep_published:
+                    self.mark_source_failed(source, f"Timed out after {timeout}s")
+                stage.fail(f"Timed out after {timeout}s", status='timeout')
+            except Exception as e:
+                logger.error(f"Source {source} failed: {e}")
+                if not keep_published:
+                    self.mark_source_failed(source, str(e))
+                stage.fail(str(e))
+
+    def source_functions(self):
+        """取得元の名前と取得処理の対応"""
+        return {
+            'market': self.fetch_market_data,
+            'indicators': self.fetch_economic_indicators,
+            'news': self.fetch_news,
+            'fear_greed': self.fetch_fear_greed_data
+        }
+
+    async def fetch_sources_async(self, sources=None, keep_published=False):
+        """独立した取得元を並列に実行（sourcesを省略した場合はすべて、keep_publishedはrun_sourceを参照）"""
+        started = time.perf_counter()
+        functions = self.source_functions()
+        with self.running_sources():
+            await asyncio.gather(*(
+                self.run_source(source, functions[source], keep_published)
+                for source in (sources or functions)
+            ))
+        logger.info(f"All sources fetched in {time.perf_counter() - started:.2f}s")
 
     def fetch_raw_data(self):
         """Fetches raw market data and saves to a temporary file."""
         logger.info("Starting raw data fetch...")
-        self.fetch_vix_data()
-        self.fetch_t_note_future()
-        self.fetch_economic_indicators()
-        self.fetch_news()
+        self.metrics.mode = 'fetch'
+        asyncio.run(self.fetch_sources_async())
         self.save_raw_data()
+        self.save_run_record(RAW_RUN_RECORD_FILE)
         logger.info("Raw data fetch completed.")
 
     async def generate_report_async(self):
         """Loads raw data, generates reports and screenshots, and saves final data."""
         logger.info("Starting report generation...")
+        self.metrics.mode = 'generate'
         self.load_raw_data()
 
         # Update timestamp
         self.data['last_updated'] = datetime.now(TZ_JST).isoformat()
 
-        # Fetch screenshots
-        await self.fetch_all_async()
+        # Fetch screenshots and generate AI content concurrently
+        await asyncio.gather(
+            self.fetch_all_async(),
+            self.generate_ai_commentary(),
+            self.generate_ai_column()
+        )
 
-        # Generate AI content
-        self.generate_ai_commentary()
-        self.generate_ai_column()
-        
         # Save final output
         self.save_data()
+        self.save_run_record(f"run_{self.data['date']}.json")
         logger.info("Report generation completed.")
 
+    async def run_async(self, weekly_column=None):
+        """取得からレポート生成・保存までを依存関係に沿って1回で実行
+
+        weekly_columnはgenerate_ai_columnのweeklyに渡す。
+        """
+        logger.info("Starting pipelined run...")
+        self.metrics.mode = 'run'
+        graph = TaskGraph()
+
+        # 取得元とスクリーンショットは即座に開始
+        graph.add('market', lambda: self.run_source('market', self.fetch_market_data))
+        graph.add('indicators', lambda: self.run_source('indicators', self.fetch_economic_indicators))
+        graph.add('news', lambda: self.run_source('news', self.fetch_news))
+
+        # Fear & Greedのスクリーンショットは代替手段なので、JSONの取得結果を待って判断する
+        # （ヒートマップの撮影は待たずに始める）
+        fear_greed_done = asyncio.Event()
+
+        async def fetch_fear_greed():
+            try:
+                await self.run_source('fear_greed', self.fetch_fear_greed_data)
+            finally:
+                fear_greed_done.set()
+
+        graph.add('fear_greed', fetch_fear_greed)
+        graph.add('screenshots', lambda: self.fetch_all_async(fear_greed_done))
+
+        # 市況解説は市場データの取得後、コラムは入力が不要なので即座に開始
+        graph.add('ai_commentary', self.generate_ai_commentary, deps=['market'])
+        graph.add('ai_column', lambda: self.generate_ai_column(weekly_column))
+
+        # すべて揃ってから保存
+        graph.add('save', self.save_final_data_async, deps=[
+            'market', 'indicators', 'news', 'fear_greed', 'screenshots', 'ai_commentary', 'ai_column'
+        ])
+
+        with self.running_sources():
+            await graph.run()
+        logger.info("Pipelined run completed.")
+
+    def load_latest_data(self):
+        """latest.jsonが指す公開済みの最新データを読み込む（なければFalse）"""
+        try:
+            with open(os.path.join(DATA_DIR, LATEST_MANIFEST_FILE), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            with open(os.path.join(DATA_DIR, manifest['file']), 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+        except FileNotFoundError:
+            return False
+        logger.info(f"Latest data loaded: {manifest['file']}")
+        return True
+
+    async def refresh_async(self, sources=INTRADAY_REFRESH_SOURCES):
+        """公開済みの最新データのうち指定の取得元だけを取り直して保存
+
+        スクリーンショットとAI生成は行わず、前回の内容をそのまま残す。
+        失敗した取得元（項目）も、エラー値で上書きせず公開済みの値を残す。
+        """
+        logger.info(f"Starting refresh of {', '.join(sources)}...")
+        self.metrics.mode = 'refresh'
+        if not self.load_latest_data():
+            logger.warning("No published data to refresh")
+            return
+
+        await self.fetch_sources_async(sources, keep_published=True)
+        await self.save_final_data_async(record_run=False)
+        logger.info("Refresh completed.")
+
+    async def save_final_data_async(self, record_run=True):
+        """最終データのタイムスタンプを更新して保存
+
+        場中の更新（record_run=False）では、その日の実行記録を上書きしない。
+        """
+        self.data['last_updated'] = datetime.now(TZ_JST).isoformat()
+        await asyncio.to_thread(self.save_data)
+        if record_run:
+            self.save_run_record(f"run_{self.data['date']}.json")
+
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2 or sys.argv[1] not in ['fetch', 'generate']:
-        print("Usage: python data_fetcher.py [fetch|generate]", file=sys.stderr)
+    if len(sys.argv) != 2 or sys.argv[1] not in ['fetch', 'generate', 'run', 'refresh']:
+        print("Usage: python data_fetcher.py [fetch|generate|run|refresh]", file=sys.stderr)
         sys.exit(1)
 
     mode = sys.argv[1]
@@ -493,4 +1402,8 @@ if __name__ == "__main__":
     if mode == 'fetch':
         fetcher.fetch_raw_data()
     elif mode == 'generate':
-        asyncio.run(fetcher.generate_report_async())
\ No newline at end of file
+        asyncio.run(fetcher.generate_report_async())
+    elif mode == 'run':
+        asyncio.run(fetcher.run_async())
+    elif mode == 'refresh':
+        asyncio.run(fetcher.refresh_async())
@@ -0,0 +1,69 @@
+import io
+from PIL import Image, ImageChops
+
+# AVIFはプラグイン（pillow-avif-plugin）がある場合のみ生成する
+try:
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+# 余白とみなす背景色との差（0-255）
+TRIM_TOLERANCE = 8
+
+
+def avif_supported():
+    """AVIFで保存できるか"""
+    Image.init()
+    return 'AVIF' in Image.SAVE
+
+
+def trim_border(image, tolerance=TRIM_TOLERANCE):
+    """左上の画素と同じ色の余白を四辺から取り除く"""
+    background = Image.new(image.mode, image.size, image.getpixel((0, 0)))
+    diff = ImageChops.difference(image, background).convert('L')
+    bbox = diff.point(lambda value: 255 if value > tolerance else 0).getbbox()
+    if bbox is None or bbox == (0, 0) + image.size:
+        return image
+    return image.crop(bbox)
+
+
+def encode(image, fmt, webp_quality, avif_quality):
+    buffer = io.BytesIO()
+    if fmt == 'webp':
+        image.save(buffer, 'WEBP', quality=webp_quality, method=6)
+    elif fmt == 'avif':
+        image.save(buffer, 'AVIF', quality=avif_quality)
+    else:
+        image.save(buffer, 'PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def optimize_screenshot(png_bytes, sizes, webp_quality=80, avif_quality=60):
+    """撮影したPNGの余白を除き、サイズ・形式ごとに再エンコードする
+
+    ProcessPoolExecutorのワーカーで実行されるため、引数・戻り値はpickle可能な値のみ。
+    sizesは{名前: 最大幅}。元画像の幅を超えるサイズは作らず、同じ幅になるサイズは1つにまとめる。
+    戻り値のsizesは幅の小さい順で、各要素のencodedは{形式: バイト列}。
+    """
+    with Image.open(io.BytesIO(png_bytes)) as source:
+        image = trim_border(source.convert('RGB'))
+
+    formats = ['avif', 'webp', 'png'] if avif_supported() else ['webp', 'png']
+    variants = []
+    widths = set()
+    for name, max_width in sorted(sizes.items(), key=lambda item: item[1]):
+        width = min(max_width, image.width)
+        if width in widths:
+            continue
+        widths.add(width)
+
+        height = round(image.height * width / image.width)
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+        variants.append({
+            'name': name,
+            'width': width,
+            'height': height,
+            'encoded': {fmt: encode(resized, fmt, webp_quality, avif_quality) for fmt in formats}
+        })
+
+    return {'width': image.width, 'height': image.height, 'sizes': variants}
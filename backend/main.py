@@ -1,14 +1,210 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.routing import Mount
+import asyncio
+import hashlib
 import json
+import logging
+import mmap
 import os
-from datetime import datetime
-from config import DATA_DIR
+import re
+import time
+from config import DATA_DIR, SNAPSHOT_CACHE_MAX_BYTES, SNAPSHOT_POLL_SECONDS, SSE_KEEPALIVE_SECONDS
+from snapshot_format import SCREENSHOT_HASH_PATTERN, brotli, serialize_json
+from snapshot_store import EncodedBody, SnapshotStore
+from run_metrics import LatencyHistogram, load_latest_run_record, render_run_metrics
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Investment Dashboard API")
 
+FRONTEND_DIR = '../frontend'
+# 内容が変わればURLも変わるリソース向けのキャッシュ指定
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# スクリーンショットはSHA-256のファイル名で保存される（拡張子は形式ごと）
+SCREENSHOTS_DIR = os.path.join(DATA_DIR, 'screenshots')
+SCREENSHOT_MEDIA_TYPES = {'webp': 'image/webp', 'avif': 'image/avif', 'png': 'image/png'}
+
+DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+# マップしたファイルを送る際の1回あたりのバイト数
+MAPPED_CHUNK_BYTES = 256 * 1024
+
+snapshot_store = SnapshotStore(DATA_DIR, SNAPSHOT_CACHE_MAX_BYTES)
+
+# APIの処理時間（ルートのパステンプレートごと）
+# ワーカーごとの集計なので、複数ワーカーでは/api/metricsの値が応答したワーカーによって変わる
+request_latency = LatencyHistogram('hanaview_http_request_duration_seconds', 'APIリクエストの処理時間（秒）')
+# SSEは接続が続く間ずっと応答中になるため計測しない
+UNTIMED_PATHS = {'/api/events'}
+
+
+class SnapshotNotifier:
+    """新しいスナップショットの公開を検知し、接続中のクライアントに知らせる
+
+    データ生成は別プロセスで動くため、latest.jsonを定期的に確認する。
+    待機中のクライアントはすべて1つのEventを共有し、接続ごとのタスクや
+    キューは持たない（アイドル接続のコストはコルーチン1つ分）。
+    """
+
+    def __init__(self, store, interval):
+        self.store = store
+        self.interval = interval
+        self.version = None
+        self._changed = asyncio.Event()
+
+    def notify(self):
+        """最新バージョンを確認し、変わっていれば待機中のクライアントを起こす"""
+        try:
+            version = self.store.latest_version()
+        except Exception as e:
+            logger.error(f"Error checking latest snapshot: {e}")
+            return
+
+        if version != self.version:
+            self.version = version
+            changed, self._changed = self._changed, asyncio.Event()
+            changed.set()
+
+    async def watch(self):
+        while True:
+            self.notify()
+            await asyncio.sleep(self.interval)
+
+    async def wait(self, version, timeout):
+        """versionから変わるまで待ち、新しいバージョンを返す（timeout経過ならNone）"""
+        if self.version != version:
+            return self.version
+
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        return self.version
+
+
+snapshot_notifier = SnapshotNotifier(snapshot_store, SNAPSHOT_POLL_SECONDS)
+
+
+def etag_matches(request, etag):
+    """If-None-Matchヘッダーが指定のETagに一致するか判定"""
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    return etag in (tag.strip() for tag in header.split(','))
+
+
+class MappedResponse(Response):
+    """メモリにマップしたファイルの内容を、ワーカー内にコピーを持たずに分割して送る
+
+    送信中はmmapを参照し続けるため、途中で新しい版に切り替わっても
+    このレスポンスは古い版を最後まで送る。
+    """
+
+    def render(self, content):
+        return content
+
+    async def __call__(self, scope, receive, send):
+        await send({
+            'type': 'http.response.start',
+            'status': self.status_code,
+            'headers': self.raw_headers
+        })
+        body = self.body
+        for start in range(0, len(body), MAPPED_CHUNK_BYTES):
+            end = start + MAPPED_CHUNK_BYTES
+            await send({'type': 'http.response.body', 'body': body[start:end], 'more_body': end < len(body)})
+
+
+def body_response(content, media_type, headers):
+    """本文がmmapならMappedResponse、bytesならResponseを返す（空のファイルはbytesになる）"""
+    response_class = MappedResponse if isinstance(content, mmap.mmap) else Response
+    return response_class(content=content, media_type=media_type, headers=headers)
+
+
+def encoded_response(request, encoded, media_type='application/json', cache_control='no-cache'):
+    """圧縮方式を交渉して事前エンコード済みの本文を返す（ETag一致時は304）"""
+    encoding = encoded.negotiate(request.headers.get('accept-encoding'))
+    headers = {
+        'ETag': encoded.etag(encoding),
+        'Cache-Control': cache_control,
+        'Vary': 'Accept-Encoding'
+    }
+    if etag_matches(request, headers['ETag']):
+        return Response(status_code=304, headers=headers)
+
+    if encoding:
+        headers['Content-Encoding'] = encoding
+        return body_response(encoded.variants[encoding], media_type, headers)
+    return body_response(encoded.body, media_type, headers)
+
+
+class AssetFiles(StaticFiles):
+    """css/jsを圧縮して配信する静的ファイル
+
+    圧縮結果はファイルのmtimeごとにメモリに保持する。
+    ?v=（フィンガープリント）付きのURLには長期キャッシュを指定する。
+    """
+
+    def __init__(self, directory):
+        super().__init__(directory=directory)
+        self._encoded = {}
+
+    def _encode(self, path, stat):
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        encoded = self._encoded.get(key)
+        if encoded is None:
+            with open(path, 'rb') as f:
+                body = f.read()
+            variants = {'br': brotli.compress(body)} if brotli is not None else {}
+            encoded = EncodedBody(body, variants)
+            self._encoded[key] = encoded
+        return encoded
+
+    async def get_response(self, path, scope):
+        response = await super().get_response(path, scope)
+        if not isinstance(response, FileResponse) or response.status_code != 200:
+            return response
+
+        fingerprinted = b'v=' in scope.get('query_string', b'')
+        cache_control = IMMUTABLE_CACHE_CONTROL if fingerprinted else 'no-cache'
+        request = Request(scope)
+        encoded = self._encode(response.path, os.stat(response.path))
+        return encoded_response(request, encoded, response.media_type, cache_control)
+
+
+class IndexPage:
+    """css/jsのURLにフィンガープリントを付けたindex.htmlを保持する"""
+
+    ASSETS = ('css/styles.css', 'js/app.js')
+
+    def __init__(self, frontend_dir):
+        self.frontend_dir = frontend_dir
+        self._key = None
+        self._encoded = None
+
+    def get(self):
+        paths = [os.path.join(self.frontend_dir, name) for name in ('index.html',) + self.ASSETS]
+        key = tuple(os.stat(path).st_mtime_ns for path in paths)
+        if key != self._key:
+            with open(paths[0], 'r', encoding='utf-8') as f:
+                html = f.read()
+            for name, path in zip(self.ASSETS, paths[1:]):
+                with open(path, 'rb') as f:
+                    fingerprint = hashlib.sha256(f.read()).hexdigest()[:12]
+                html = html.replace(f'"{name}"', f'"{name}?v={fingerprint}"')
+            self._encoded = EncodedBody(html.encode('utf-8'))
+            self._key = key
+        return self._encoded
+
+
+index_page = IndexPage(FRONTEND_DIR)
+
 # CORS設定
 app.add_middleware(
     CORSMiddleware,
@@ -18,39 +214,209 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class RequestLatencyMiddleware:
+    """リクエストの処理時間（応答の送信完了まで）をヒストグラムに記録するASGIミドルウェア
+
+    ルートはルーターが一致時にscopeへ書き込むendpointから引く。endpointから
+    パステンプレートへの対応はルートの一覧から一度だけ作る。
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._templates = None
+
+    def route_template(self, scope):
+        """一致したルートのパステンプレート（ラベルの種類を抑えるため）"""
+        if self._templates is None:
+            templates = {}
+            for route in scope['app'].router.routes:
+                templates.setdefault(route.app if isinstance(route, Mount) else route.endpoint, route.path)
+            self._templates = templates
+        return self._templates.get(scope.get('endpoint'), 'unmatched')
+
+    async def __call__(self, scope, receive, send):
+        # SSEは接続が続く間ずっと応答中になるため計測せずにそのまま渡す
+        if scope['type'] != 'http' or scope['path'] in UNTIMED_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope['method']
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            request_latency.observe(
+                {'method': method, 'route': self.route_template(scope), 'status': status},
+                time.perf_counter() - started
+            )
+
+app.add_middleware(RequestLatencyMiddleware)
+
 # 静的ファイルのマウント（css, js）
-app.mount("/css", StaticFiles(directory="../frontend/css"), name="css")
-app.mount("/js", StaticFiles(directory="../frontend/js"), name="js")
+app.mount("/css", AssetFiles(directory=f"{FRONTEND_DIR}/css"), name="css")
+app.mount("/js", AssetFiles(directory=f"{FRONTEND_DIR}/js"), name="js")
 
 @app.get("/")
-async def read_index():
+async def read_index(request: Request):
     """index.htmlを返す"""
-    return FileResponse('../frontend/index.html')
+    return encoded_response(request, index_page.get(), media_type='text/html; charset=utf-8')
+
+@app.on_event("startup")
+async def build_snapshot_index():
+    """保存済みデータの索引を起動時に作成し、新しいデータの監視を開始"""
+    snapshot_store.refresh_index()
+    snapshot_notifier.notify()
+    asyncio.create_task(snapshot_notifier.watch())
+
+@app.get("/api/events")
+async def snapshot_events():
+    """新しいデータが公開されるたびにバージョンIDをServer-Sent Eventsで送る"""
+    async def stream():
+        version = snapshot_notifier.version
+        yield f"retry: 5000\nevent: snapshot\ndata: {json.dumps({'version': version})}\n\n"
+        while True:
+            new_version = await snapshot_notifier.wait(version, SSE_KEEPALIVE_SECONDS)
+            if new_version is None:
+                # プロキシに切断されないよう定期的にコメント行を送る
+                yield ": keepalive\n\n"
+                continue
+            version = new_version
+            yield f"event: snapshot\ndata: {json.dumps({'version': version})}\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def get_latest_snapshot():
+    """最新のスナップショットを返す（なければ404）"""
+    try:
+        snapshot = snapshot_store.get_latest()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="No data available")
+    return snapshot
+
+def data_response(request, snapshot, fields):
+    """スナップショット全体、またはfieldsで指定したフィールドのみを返す"""
+    if not fields:
+        return encoded_response(request, snapshot.encoded)
+
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    unknown = [name for name in names if name not in snapshot.data]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return encoded_response(request, snapshot.fields(names))
 
 @app.get("/api/data")
-async def get_market_data():
-    """最新の市場データを返す"""
+async def get_market_data(request: Request, fields: str = Query(None)):
+    """最新の市場データを返す（fields=market,news のように取得するフィールドを指定可能）"""
+    return data_response(request, get_latest_snapshot(), fields)
+
+@app.get("/api/dates")
+async def get_dates(request: Request):
+    """データが保存されている日付の一覧を新しい順に返す"""
+    dates = snapshot_store.dates()
+    body = serialize_json({'dates': dates, 'latest': snapshot_store.latest_date()})
+    return encoded_response(request, EncodedBody(body))
+
+@app.get("/api/data/{date}")
+async def get_market_data_by_date(request: Request, date: str, fields: str = Query(None)):
+    """指定日（YYYY-MM-DD）の市場データを返す"""
+    if not DATE_PATTERN.match(date):
+        raise HTTPException(status_code=400, detail="Date must be YYYY-MM-DD")
+
     try:
-        # 今日のデータファイルを探す
-        today = datetime.now().strftime('%Y-%m-%d')
-        filename = f"{DATA_DIR}/data_{today}.json"
-        
-        if not os.path.exists(filename):
-            # 今日のデータがない場合は最新のファイルを探す
-            files = sorted([f for f in os.listdir(DATA_DIR) if f.startswith('data_')])
-            if files:
-                filename = f"{DATA_DIR}/{files[-1]}"
-            else:
-                raise HTTPException(status_code=404, detail="No data available")
-        
-        with open(filename, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        
-        return data
-        
+        snapshot = snapshot_store.get(date)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail=f"No data available for {date}")
+    return data_response(request, snapshot, fields)
+
+@app.get("/api/heatmap/{index}/{period}")
+async def get_heatmap(request: Request, index: str, period: str):
+    """指数・期間を指定してヒートマップの画像参照を返す"""
+    encoded = get_latest_snapshot().heatmap(index, period)
+    if encoded is None:
+        raise HTTPException(status_code=404, detail="Heatmap not found")
+    return encoded_response(request, encoded)
+
+@app.get("/api/history/{name}/{timeframe}")
+async def get_history(request: Request, name: str, timeframe: str):
+    """銘柄・時間足（1h, 4h, 1d）を指定してOHLCの履歴を返す"""
+    encoded = get_latest_snapshot().history(name, timeframe)
+    if encoded is None:
+        raise HTTPException(status_code=404, detail="History not found")
+    return encoded_response(request, encoded)
+
+@app.get("/api/market")
+async def get_market(request: Request):
+    """最新データの市況セクションを返す"""
+    return encoded_response(request, get_latest_snapshot().section('market'))
+
+@app.get("/api/news")
+async def get_news(request: Request):
+    """最新データのニュースセクションを返す"""
+    return encoded_response(request, get_latest_snapshot().section('news'))
+
+@app.get("/api/indicators")
+async def get_indicators(request: Request):
+    """最新データの経済指標セクションを返す"""
+    return encoded_response(request, get_latest_snapshot().section('indicators'))
+
+@app.get("/api/column")
+async def get_column(request: Request):
+    """最新データのコラムセクションを返す"""
+    return encoded_response(request, get_latest_snapshot().section('column'))
+
+@app.get("/api/screenshots/{image_hash}")
+async def get_screenshot(image_hash: str):
+    """コンテンツハッシュで指定されたスクリーンショットを返す"""
+    if not SCREENSHOT_HASH_PATTERN.match(image_hash):
+        raise HTTPException(status_code=404, detail="Screenshot not found")
+
+    # ハッシュは内容ごとに一意なので、存在する拡張子のファイルが該当する画像
+    for ext, media_type in SCREENSHOT_MEDIA_TYPES.items():
+        path = os.path.join(SCREENSHOTS_DIR, f"{image_hash}.{ext}")
+        if os.path.exists(path):
+            # 内容が変わればハッシュも変わるため、永続的にキャッシュさせる
+            return FileResponse(
+                path,
+                media_type=media_type,
+                headers={'Cache-Control': IMMUTABLE_CACHE_CONTROL}
+            )
+
+    raise HTTPException(status_code=404, detail="Screenshot not found")
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """最新のデータ生成の実行記録とAPIの処理時間をPrometheus形式で返す"""
+    try:
+        record = load_latest_run_record(DATA_DIR)
+    except Exception as e:
+        logger.error(f"Error loading run record: {e}")
+        record = None
+
+    lines = render_run_metrics(record) + request_latency.render()
+    return Response(
+        content='\n'.join(lines) + '\n',
+        media_type='text/plain; version=0.0.4; charset=utf-8',
+        headers={'Cache-Control': 'no-store'}
+    )
+
 @app.get("/api/health")
 async def health_check():
     return {"status": "healthy"}
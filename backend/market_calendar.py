@@ -0,0 +1,110 @@
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from config import TZ_US_EASTERN
+
+# NYSEの通常取引時間（米国東部時間）と短縮取引日の引け
+MARKET_OPEN = time(9, 30)
+MARKET_CLOSE = time(16, 0)
+EARLY_CLOSE = time(13, 0)
+
+
+def easter(year):
+    """グレゴリオ暦の復活祭の日付"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def nth_weekday(year, month, weekday, n):
+    """month月の第n weekday（n=-1で最終）"""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def observed(day):
+    """土曜の祝日は前日の金曜、日曜の祝日は翌日の月曜に休場"""
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+@lru_cache(maxsize=None)
+def holidays(year):
+    """NYSEの休場日（振替後）"""
+    days = {
+        nth_weekday(year, 1, 0, 3),        # キング牧師記念日
+        nth_weekday(year, 2, 0, 3),        # ワシントン誕生日
+        easter(year) - timedelta(days=2),  # 聖金曜日
+        nth_weekday(year, 5, 0, -1),       # メモリアルデー
+        observed(date(year, 7, 4)),        # 独立記念日
+        nth_weekday(year, 9, 0, 1),        # レイバーデー
+        nth_weekday(year, 11, 3, 4),       # 感謝祭
+        observed(date(year, 12, 25)),      # クリスマス
+    }
+    # 元日が土曜の場合、前年12/31は振替休場にならない
+    new_year = date(year, 1, 1)
+    if new_year.weekday() != 5:
+        days.add(observed(new_year))
+    # ジューンティーンス（2022年から）
+    if year >= 2022:
+        days.add(observed(date(year, 6, 19)))
+    return frozenset(days)
+
+
+@lru_cache(maxsize=None)
+def early_closes(year):
+    """13:00で引ける短縮取引日"""
+    days = {
+        nth_weekday(year, 11, 3, 4) + timedelta(days=1),  # 感謝祭の翌日
+        date(year, 12, 24),                               # クリスマス・イブ
+        date(year, 7, 3),                                 # 独立記念日の前日
+    }
+    return frozenset(day for day in days if is_trading_day(day))
+
+
+def is_trading_day(day):
+    return day.weekday() < 5 and day not in holidays(day.year)
+
+
+def is_last_session_of_week(day):
+    """dayがその週の最後の取引日か（通常は金曜日、金曜日が休場なら木曜日など）"""
+    if not is_trading_day(day):
+        return False
+    following = day + timedelta(days=1)
+    while not is_trading_day(following):
+        following += timedelta(days=1)
+    return following.isocalendar()[:2] != day.isocalendar()[:2]
+
+
+def market_session(day):
+    """取引日の寄り付き・引けの時刻（米国東部時間、休場日はNone）"""
+    if not is_trading_day(day):
+        return None
+    close = EARLY_CLOSE if day in early_closes(day.year) else MARKET_CLOSE
+    return (
+        TZ_US_EASTERN.localize(datetime.combine(day, MARKET_OPEN)),
+        TZ_US_EASTERN.localize(datetime.combine(day, close))
+    )
+
+
+def trading_sessions(start):
+    """start（日時）の米国東部時間の日付以降の取引時間を順に返す"""
+    day = start.astimezone(TZ_US_EASTERN).date()
+    while True:
+        session = market_session(day)
+        if session is not None:
+            yield session
+        day += timedelta(days=1)
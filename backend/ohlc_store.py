@@ -0,0 +1,87 @@
+import contextlib
+import sqlite3
+import pandas as pd
+
+# 保存するOHLCVの列（DataFrameの列名 -> テーブルの列名）
+BAR_COLUMNS = {
+    'Open': 'open',
+    'High': 'high',
+    'Low': 'low',
+    'Close': 'close',
+    'Volume': 'volume'
+}
+
+
+class OHLCStore:
+    """銘柄ごとの1時間足を追記保存するSQLiteストア
+
+    バーはシンボルと開始時刻（エポック秒）で一意になり、
+    同じ時刻のバーを再取得した場合は新しい値で上書きする。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS bars (
+                    symbol TEXT NOT NULL,
+                    time INTEGER NOT NULL,
+                    open REAL,
+                    high REAL,
+                    low REAL,
+                    close REAL,
+                    volume REAL,
+                    PRIMARY KEY (symbol, time)
+                ) WITHOUT ROWID
+            """)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def last_timestamp(self, symbol):
+        """保存済みの最新バーの時刻（エポック秒）を返す（未保存ならNone）"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT MAX(time) FROM bars WHERE symbol = ?", (symbol,)).fetchone()
+        return row[0]
+
+    def upsert(self, symbol, hist):
+        """タイムゾーン付きインデックスのOHLCVを保存し、保存した本数を返す"""
+        hist = hist.dropna(subset=['Close'])
+        if hist.empty:
+            return 0
+
+        times = (pd.to_datetime(hist.index).asi8 // 1_000_000_000).tolist()
+        values = [
+            hist[column].to_numpy(dtype=float).tolist() if column in hist else [None] * len(hist)
+            for column in BAR_COLUMNS
+        ]
+        rows = [(symbol, time, *bar) for time, *bar in zip(times, *values)]
+
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO bars (symbol, time, open, high, low, close, volume) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        return len(rows)
+
+    def load(self, symbol, since=None):
+        """保存済みのバーをUTCインデックスのDataFrameとして返す"""
+        query = "SELECT time, open, high, low, close, volume FROM bars WHERE symbol = ?"
+        params = [symbol]
+        if since is not None:
+            query += " AND time >= ?"
+            params.append(int(since))
+        query += " ORDER BY time"
+
+        with self._connect() as conn:
+            frame = pd.read_sql_query(query, conn, params=params)
+
+        frame.index = pd.to_datetime(frame.pop('time'), unit='s', utc=True)
+        return frame.rename(columns={v: k for k, v in BAR_COLUMNS.items()})
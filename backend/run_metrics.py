@@ -0,0 +1,244 @@
+import bisect
+import contextlib
+import contextvars
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from config import TZ_JST
+
+# 実行記録ファイル（run_YYYY-MM-DD.json）
+RUN_RECORD_PATTERN = re.compile(r'^run_(\d{4}-\d{2}-\d{2})\.json$')
+
+# APIレイテンシのヒストグラムの境界（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# 実行中のステージ（asyncioのタスク・to_threadのスレッドに引き継がれる）
+_current_stage = contextvars.ContextVar('current_stage', default=None)
+
+
+class StageMetrics:
+    """1つのステージ（取得・撮影・AI生成など）の計測値
+
+    status は running / ok / failed / timeout のいずれか。
+    bytes は受信したレスポンスのバイト数（撮影ステージは画像、AIは応答本文のバイト数）。
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.started_at = time.time()
+        self.duration_seconds = None
+        self.bytes = 0
+        self.retries = 0
+        self.status = 'running'
+        self.error = None
+        self._lock = threading.Lock()
+
+    def add_bytes(self, count):
+        with self._lock:
+            self.bytes += count
+
+    def add_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def fail(self, error, status='failed'):
+        self.status = status
+        self.error = error
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'status': self.status,
+            'started_at': self.started_at,
+            'duration_seconds': self.duration_seconds,
+            'bytes': self.bytes,
+            'retries': self.retries,
+            'error': self.error
+        }
+
+
+class RunRecorder:
+    """1回の実行のステージごとの計測値を集める
+
+    ステージ内の処理はrecord_bytes・record_retry・failで現在のステージに記録する。
+    ステージの文脈を持たないスレッド（yfinanceの並列ダウンロード等）からの記録は、
+    untracked_stageで指定したステージに割り当てる。
+    """
+
+    def __init__(self, mode=None):
+        self.mode = mode
+        self.started_at = time.time()
+        self.stages = []
+        self._untracked = None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """ブロックの実行時間・状態をステージとして記録する（例外はそのまま送出）"""
+        stage = StageMetrics(name)
+        self.stages.append(stage)
+        token = _current_stage.set(stage)
+        started = time.perf_counter()
+        try:
+            yield stage
+        except Exception as e:
+            stage.fail(str(e))
+            raise
+        finally:
+            stage.duration_seconds = round(time.perf_counter() - started, 3)
+            if stage.status == 'running':
+                stage.status = 'ok'
+            _current_stage.reset(token)
+
+    @contextlib.contextmanager
+    def untracked_stage(self, stage):
+        """ブロックの間、ステージの文脈を持たないスレッドからの記録をstageに割り当てる"""
+        previous, self._untracked = self._untracked, stage
+        try:
+            yield
+        finally:
+            self._untracked = previous
+
+    def current(self):
+        return _current_stage.get() or self._untracked
+
+    def record_bytes(self, count):
+        stage = self.current()
+        if stage is not None:
+            stage.add_bytes(count)
+
+    def record_retry(self):
+        stage = self.current()
+        if stage is not None:
+            stage.add_retry()
+
+    def fail(self, error, status='failed'):
+        """現在のステージを失敗として記録（例外を握りつぶす処理から呼ぶ）"""
+        stage = self.current()
+        if stage is not None:
+            stage.fail(error, status)
+
+    def merge(self, record):
+        """別プロセスで保存された実行記録のステージを先頭に取り込む（fetch→generate用）"""
+        self.started_at = min(self.started_at, record['started_at'])
+        restored = []
+        for item in record['stages']:
+            stage = StageMetrics(item['name'])
+            stage.started_at = item['started_at']
+            stage.duration_seconds = item['duration_seconds']
+            stage.bytes = item['bytes']
+            stage.retries = item['retries']
+            stage.status = item['status']
+            stage.error = item['error']
+            restored.append(stage)
+        self.stages = restored + self.stages
+
+    def to_dict(self):
+        finished_at = time.time()
+        stages = [stage.to_dict() for stage in self.stages]
+        return {
+            'mode': self.mode,
+            'started_at': self.started_at,
+            'finished_at': finished_at,
+            'started_at_jst': datetime.fromtimestamp(self.started_at, TZ_JST).isoformat(),
+            'duration_seconds': round(finished_at - self.started_at, 3),
+            'status': 'ok' if all(stage['status'] == 'ok' for stage in stages) else 'degraded',
+            'stages': stages
+        }
+
+
+def load_latest_run_record(data_dir):
+    """最新の実行記録を返す（なければNone）"""
+    try:
+        names = sorted(name for name in os.listdir(data_dir) if RUN_RECORD_PATTERN.match(name))
+    except FileNotFoundError:
+        return None
+    if not names:
+        return None
+    with open(os.path.join(data_dir, names[-1]), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def format_labels(labels):
+    """Prometheusのラベル表記（{key="value",...}）にする"""
+    if not labels:
+        return ''
+    pairs = []
+    for key, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class LatencyHistogram:
+    """ラベルごとのレイテンシ分布（Prometheusのhistogram形式で出力）"""
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, seconds):
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0}
+            series['counts'][index] += 1
+            series['sum'] += seconds
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: (list(value['counts']), value['sum']) for key, value in self._series.items()}
+
+        for key, (counts, total) in sorted(series.items()):
+            labels = dict(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{format_labels({**labels, 'le': bound})} {cumulative}")
+            cumulative += counts[-1]
+            lines.append(f"{self.name}_bucket{format_labels({**labels, 'le': '+Inf'})} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{format_labels(labels)} {cumulative}")
+        return lines
+
+
+def render_run_metrics(record):
+    """実行記録をPrometheusのgauge形式の行にする"""
+    gauges = {
+        'hanaview_pipeline_run_timestamp_seconds': ('最新の実行の開始時刻（UNIX時間）', []),
+        'hanaview_pipeline_run_duration_seconds': ('最新の実行の所要時間', []),
+        'hanaview_pipeline_run_success': ('最新の実行で全ステージが成功したか（1/0）', []),
+        'hanaview_pipeline_stage_duration_seconds': ('ステージの所要時間', []),
+        'hanaview_pipeline_stage_bytes': ('ステージで取得したバイト数', []),
+        'hanaview_pipeline_stage_retries': ('ステージでの再試行回数', []),
+        'hanaview_pipeline_stage_success': ('ステージが成功したか（1/0）', []),
+    }
+    if record is not None:
+        run_labels = {'mode': record['mode']}
+        gauges['hanaview_pipeline_run_timestamp_seconds'][1].append((run_labels, record['started_at']))
+        gauges['hanaview_pipeline_run_duration_seconds'][1].append((run_labels, record['duration_seconds']))
+        gauges['hanaview_pipeline_run_success'][1].append((run_labels, int(record['status'] == 'ok')))
+
+        # 同名のステージが複数回実行された場合は後のものを出力する
+        stages = {stage['name']: stage for stage in record['stages']}
+        for name, stage in sorted(stages.items()):
+            labels = {'stage': name}
+            gauges['hanaview_pipeline_stage_duration_seconds'][1].append((labels, stage['duration_seconds'] or 0))
+            gauges['hanaview_pipeline_stage_bytes'][1].append((labels, stage['bytes']))
+            gauges['hanaview_pipeline_stage_retries'][1].append((labels, stage['retries']))
+            gauges['hanaview_pipeline_stage_success'][1].append((labels, int(stage['status'] == 'ok')))
+
+    lines = []
+    for name, (help_text, samples) in gauges.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(f"{name}{format_labels(labels)} {value}" for labels, value in samples)
+    return lines
@@ -0,0 +1,150 @@
+"""米国市場のカレンダーに合わせてデータ生成を実行するスケジューラー
+
+    - 日次: 各取引日の引け（夏時間・短縮取引日を考慮）+ DATA_FETCH_DELAY_MINUTES 後に全体を生成
+    - 場中: INTRADAY_REFRESH_MINUTES > 0 の場合、取引時間中にその間隔で軽量な取得元のみ更新
+休場日（土日・NYSEの祝日）は実行しない。
+
+使い方（backendディレクトリで実行）:
+    python scheduler.py            # 常駐して実行
+    python scheduler.py --list 10  # 今後の実行予定を表示
+"""
+import argparse
+import asyncio
+import collections
+import itertools
+import logging
+import os
+from datetime import datetime, timedelta
+from config import (
+    DATA_DIR,
+    DATA_FETCH_DELAY_MINUTES,
+    INTRADAY_REFRESH_MINUTES,
+    INTRADAY_REFRESH_SOURCES,
+    LATEST_MANIFEST_FILE,
+    TZ_JST
+)
+from data_fetcher import MarketDataFetcher
+from market_calendar import is_last_session_of_week, trading_sessions
+
+logger = logging.getLogger(__name__)
+
+# スリープ復帰等で時計が進んだ場合に備え、この間隔で残り時間を確認し直す
+MAX_SLEEP_SECONDS = 300
+# 場中の更新がこれ以上遅れた場合は実行せずに次へ進む（日次の実行は遅れても行う）
+REFRESH_GRACE_SECONDS = 120
+# 次の実行時刻を探す取引日数の上限
+MAX_LOOKAHEAD_SESSIONS = 15
+# serve()が予期しないエラーで止まった場合に再開するまでの待ち時間
+RESTART_DELAY_SECONDS = 60
+
+Job = collections.namedtuple('Job', ['kind', 'run_at', 'session_date'])
+
+
+def upcoming_sessions(after):
+    # 前日の引け後の実行がafterより後になる場合があるため、前日から探す
+    return itertools.islice(trading_sessions(after - timedelta(days=1)), MAX_LOOKAHEAD_SESSIONS)
+
+
+def next_daily_run(after):
+    """afterより後で最初の、引け + DATA_FETCH_DELAY_MINUTES の実行"""
+    for market_open, market_close in upcoming_sessions(after):
+        run_at = market_close + timedelta(minutes=DATA_FETCH_DELAY_MINUTES)
+        if run_at > after:
+            return Job('daily', run_at.astimezone(TZ_JST), market_close.date())
+    return None
+
+
+def next_refresh(after, interval_minutes):
+    """afterより後で最初の場中の更新（寄り付きからinterval_minutesごと、引けより前のみ）"""
+    interval = timedelta(minutes=interval_minutes)
+    for market_open, market_close in upcoming_sessions(after):
+        if after < market_open:
+            run_at = market_open + interval
+        else:
+            run_at = market_open + interval * ((after - market_open) // interval + 1)
+        if run_at < market_close:
+            return Job('refresh', run_at.astimezone(TZ_JST), market_open.date())
+    return None
+
+
+def writes_weekly_column(job):
+    """週次コラムは米国の週の最後の取引日の引け後に作る（取引日の決まらない初回実行は月曜日判定に任せる）"""
+    if job.session_date is None:
+        return None
+    return job.kind == 'daily' and is_last_session_of_week(job.session_date)
+
+
+class Scheduler:
+    def __init__(self, refresh_minutes=INTRADAY_REFRESH_MINUTES):
+        self.refresh_minutes = refresh_minutes
+
+    def next_job(self, after):
+        """afterより後で最初に実行するジョブ"""
+        jobs = [next_daily_run(after)]
+        if self.refresh_minutes > 0:
+            jobs.append(next_refresh(after, self.refresh_minutes))
+        return min((job for job in jobs if job is not None), key=lambda job: job.run_at)
+
+    def upcoming(self, count, after=None):
+        """今後count件の実行予定"""
+        job = Job(None, after or datetime.now(TZ_JST), None)
+        jobs = []
+        for _ in range(count):
+            job = self.next_job(job.run_at)
+            jobs.append(job)
+        return jobs
+
+    async def run_job(self, job):
+        fetcher = MarketDataFetcher()
+        try:
+            if job.kind == 'refresh':
+                await fetcher.refresh_async(INTRADAY_REFRESH_SOURCES)
+            else:
+                await fetcher.run_async(weekly_column=writes_weekly_column(job))
+        except Exception as e:
+            logger.error(f"Scheduled {job.kind} run for {job.session_date} failed: {e}")
+
+    async def serve(self):
+        # 公開済みのデータがなければ起動時に1回生成する
+        if not os.path.exists(os.path.join(DATA_DIR, LATEST_MANIFEST_FILE)):
+            logger.info("No published data yet, running now")
+            await self.run_job(Job('daily', datetime.now(TZ_JST), None))
+
+        after = datetime.now(TZ_JST)
+        while True:
+            job = self.next_job(after)
+            logger.info(f"Next {job.kind} run at {job.run_at.isoformat()} (US session {job.session_date})")
+
+            while (remaining := (job.run_at - datetime.now(TZ_JST)).total_seconds()) > 0:
+                await asyncio.sleep(min(remaining, MAX_SLEEP_SECONDS))
+
+            delay = (datetime.now(TZ_JST) - job.run_at).total_seconds()
+            if job.kind == 'refresh' and delay > REFRESH_GRACE_SECONDS:
+                logger.warning(f"Skipping refresh scheduled at {job.run_at.isoformat()} ({delay:.0f}s late)")
+            else:
+                await self.run_job(job)
+            after = job.run_at
+
+    async def serve_forever(self):
+        """serve()を実行し、予期しないエラーで止まった場合はログに記録して再開する"""
+        while True:
+            try:
+                await self.serve()
+            except Exception as e:
+                logger.exception(f"Scheduler stopped unexpectedly: {e}")
+                logger.info(f"Restarting scheduler in {RESTART_DELAY_SECONDS}s")
+                await asyncio.sleep(RESTART_DELAY_SECONDS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--list', type=int, metavar='N', help='今後N件の実行予定を表示して終了')
+    args = parser.parse_args()
+
+    scheduler = Scheduler()
+    if args.list:
+        for job in scheduler.upcoming(args.list):
+            column = '  + weekly column' if writes_weekly_column(job) else ''
+            print(f"{job.run_at.isoformat()}  {job.kind:<8} US session {job.session_date}{column}")
+    else:
+        asyncio.run(scheduler.serve_forever())
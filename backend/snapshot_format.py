@@ -0,0 +1,38 @@
+"""データファイル（スナップショット）の形式
+
+書き込み側（data_fetcher）と読み出し側（snapshot_store, main）で共有し、
+ファイル名・シリアライズ・圧縮版・バージョンIDの決め方がずれないようにする。
+"""
+import hashlib
+import json
+import re
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# data_YYYY-MM-DD.json のみを対象にする（data_raw.json などは除外）
+SNAPSHOT_FILE_PATTERN = re.compile(r'^data_(\d{4}-\d{2}-\d{2})\.json$')
+# 保持期間の判定対象（データファイルとその圧縮版、実行記録 run_YYYY-MM-DD.json）
+RETAINED_FILE_PATTERN = re.compile(r'^(?:data|run)_(\d{4}-\d{2}-\d{2})\.json(\.gz|\.br)?$')
+
+# スクリーンショットはSHA-256のファイル名で保存される（旧形式はBase64を直接埋め込んだ文字列）
+SCREENSHOT_HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# 保存時に作る圧縮版（圧縮方式: ファイル名の接尾辞）
+PRECOMPRESSED_SUFFIXES = {'gzip': '.gz', 'br': '.br'}
+
+
+def snapshot_filename(date):
+    return f"data_{date}.json"
+
+
+def serialize_json(value):
+    """改行・インデントなしのJSONバイト列にする"""
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def content_version(body):
+    """本文のバージョンID（ETag・latest.json・SSEで使う内容のハッシュ）"""
+    return hashlib.sha256(body).hexdigest()[:32]
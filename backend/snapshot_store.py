@@ -0,0 +1,300 @@
+import gzip
+import json
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from config import LATEST_MANIFEST_FILE
+from snapshot_format import (
+    PRECOMPRESSED_SUFFIXES,
+    SCREENSHOT_HASH_PATTERN,
+    SNAPSHOT_FILE_PATTERN,
+    content_version,
+    serialize_json
+)
+
+# フィールド指定の組み合わせごとに保持するレスポンスの上限
+MAX_CACHED_PARTS = 64
+
+
+def accepted_encodings(header):
+    """Accept-Encodingヘッダーから受け入れ可能な圧縮方式の集合を返す"""
+    encodings = set()
+    for part in (header or '').split(','):
+        name, _, params = part.partition(';')
+        name = name.strip().lower()
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            encodings.add(name)
+    return encodings
+
+
+class EncodedBody:
+    """レスポンス本文と圧縮版をまとめて保持する（生成後は変更しない）
+
+    本文・圧縮版はbytesか、ファイルを読み取り専用でマップしたmmap。
+    圧縮版はファイル保存時に作られたものがあれば再利用し、
+    gzipがなければここで一度だけ圧縮する。
+    """
+
+    def __init__(self, body, variants=None):
+        self.body = body
+        self.digest = content_version(body)
+        self.variants = dict(variants or {})
+        if 'gzip' not in self.variants:
+            self.variants['gzip'] = gzip.compress(body, compresslevel=6, mtime=0)
+        # プロセスのメモリ上にある分のバイト数（マップしたものは共有のページキャッシュなので除く）
+        self.nbytes = sum(
+            len(value) for value in (self.body, *self.variants.values())
+            if not isinstance(value, mmap.mmap)
+        )
+
+    def etag(self, encoding=None):
+        """表現（圧縮方式）ごとの強いETagを返す"""
+        return f'"{self.digest}-{encoding}"' if encoding else f'"{self.digest}"'
+
+    def negotiate(self, accept_encoding):
+        """クライアントが受け入れる最も小さい表現の圧縮方式を返す（非圧縮ならNone）"""
+        accepted = accepted_encodings(accept_encoding)
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and encoding in accepted:
+                return encoding
+        return None
+
+
+def map_file(f, stat):
+    """開いたファイルを読み取り専用でメモリにマップする（statはそのファイルのfstat）
+
+    ページキャッシュをそのまま参照するため、同じファイルをマップした
+    ワーカープロセス間で内容のコピーは1つだけになる。データファイルは
+    os.replaceで置き換えられるので、マップ中の内容が書き換わることはない。
+    """
+    if stat.st_size == 0:
+        return b''
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def read_precompressed(path, stat):
+    """保存時に作られた圧縮版をマップする（本体より新しいものは別の版なので使わない）
+
+    判定とマップは同じファイルディスクリプタで行い、その間に置き換えられた
+    別の版の圧縮版を本体のETagで返さないようにする。
+    """
+    variants = {}
+    for encoding, suffix in PRECOMPRESSED_SUFFIXES.items():
+        try:
+            with open(path + suffix, 'rb') as f:
+                variant_stat = os.fstat(f.fileno())
+                if variant_stat.st_mtime_ns > stat.st_mtime_ns:
+                    continue
+                variants[encoding] = map_file(f, variant_stat)
+        except FileNotFoundError:
+            continue
+    return variants
+
+
+def screenshot_url(ref):
+    """画像参照から既定の画像（最大サイズのPNG）のURLを返す
+
+    旧形式のハッシュ文字列にも対応し、Base64を埋め込んだ文字列はdata: URLにする
+    （フロントエンドのscreenshotUrlと同じ扱い）。
+    """
+    if isinstance(ref, dict):
+        ref = ref['sizes'][-1]['png']
+    if SCREENSHOT_HASH_PATTERN.match(ref):
+        return f"/api/screenshots/{ref}"
+    return f"data:image/png;base64,{ref}"
+
+
+class Snapshot:
+    """ディスク上のJSONバイト列（マップ済み）と、そのパース結果の組
+
+    全体のレスポンスはマップしたバイト列をそのまま返すため、パースは
+    セクション・フィールド指定のレスポンスを初めて作る時まで行わない。
+    セクション・フィールド指定ごとのレスポンスは初回要求時に生成して保持する。
+    """
+
+    def __init__(self, key, body, variants=None):
+        self.key = key
+        self.encoded = EncodedBody(body, variants)
+        self._data = None
+        self._parts = {}
+        # LRUの容量計算用。パース・レスポンスの生成に応じて増減する
+        self.nbytes = self.encoded.nbytes
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = json.loads(self.encoded.body[:])
+            # パース済みオブジェクトは本文の2倍程度として見積もる
+            self.nbytes += 2 * len(self.encoded.body)
+        return self._data
+
+    def _part(self, part_key, build):
+        encoded = self._parts.get(part_key)
+        if encoded is None:
+            if len(self._parts) >= MAX_CACHED_PARTS:
+                self.nbytes -= sum(part.nbytes for part in self._parts.values())
+                self._parts.clear()
+            encoded = EncodedBody(serialize_json(build()))
+            self._parts[part_key] = encoded
+            self.nbytes += encoded.nbytes
+        return encoded
+
+    def section(self, name):
+        """トップレベルの1セクションのレスポンスを返す"""
+        return self._part(('section', name), lambda: self.data.get(name))
+
+    def fields(self, names):
+        """指定したトップレベルのフィールドだけを含むレスポンスを返す"""
+        names = tuple(sorted(set(names)))
+        return self._part(('fields', names), lambda: {name: self.data[name] for name in names})
+
+    def history(self, name, timeframe):
+        """1銘柄・1時間足のOHLC履歴のレスポンスを返す（なければNone）"""
+        series = self.data.get('history', {}).get(name, {}).get(timeframe)
+        if series is None:
+            return None
+        return self._part(('history', name, timeframe), lambda: series)
+
+    def heatmap(self, index, period):
+        """ヒートマップ1枚分の画像参照を返す（なければNone）"""
+        image = self.data.get('screenshots', {}).get(index, {}).get(period)
+        if not image:
+            return None
+        return self._part(('heatmap', index, period), lambda: {
+            'index': index,
+            'period': period,
+            'image': image,
+            'url': screenshot_url(image)
+        })
+
+
+class SnapshotStore:
+    """日付ごとのデータファイルの索引と、スナップショットのLRUキャッシュ
+
+    索引はディレクトリのmtimeが変わった時（ファイルの追加・削除時）だけ作り直す。
+    キャッシュ済みのスナップショットもファイルのinode・mtime・サイズが
+    変わっていれば読み直す。キャッシュの上限はバイト数で指定する。
+    スナップショットの大きさはパース・レスポンスの生成で増えるため、
+    使用量は取得のたびに各スナップショットのnbytesから数え直す。
+    """
+
+    def __init__(self, data_dir, max_bytes):
+        self.data_dir = data_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index_key = None
+        self._index = {}
+        self._manifest_key = None
+        self._manifest = None
+        self._snapshots = OrderedDict()
+
+    def refresh_index(self):
+        """ディレクトリが変わっていれば日付→ファイルパスの索引を作り直す"""
+        try:
+            key = os.stat(self.data_dir).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        if key == self._index_key:
+            return self._index
+
+        index = {}
+        for name in os.listdir(self.data_dir):
+            match = SNAPSHOT_FILE_PATTERN.match(name)
+            if match:
+                index[match.group(1)] = os.path.join(self.data_dir, name)
+        self._index = index
+        self._index_key = key
+        return index
+
+    def dates(self):
+        """保存されている日付を新しい順に返す"""
+        return sorted(self.refresh_index(), reverse=True)
+
+    def manifest(self):
+        """latest.jsonの内容を返す（なければNone）"""
+        manifest_path = os.path.join(self.data_dir, LATEST_MANIFEST_FILE)
+        try:
+            stat = os.stat(manifest_path)
+        except FileNotFoundError:
+            return None
+
+        key = (stat.st_ino, stat.st_mtime_ns)
+        if key != self._manifest_key:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                self._manifest = json.load(f)
+            self._manifest_key = key
+        return self._manifest
+
+    def latest_date(self):
+        """latest.jsonが指す日付、なければ最新の日付を返す"""
+        manifest = self.manifest()
+        if manifest is not None:
+            return manifest['date']
+
+        dates = self.dates()
+        return dates[0] if dates else None
+
+    def latest_version(self):
+        """最新データのバージョンID（内容のハッシュ）を返す（データがなければNone）"""
+        manifest = self.manifest()
+        if manifest is not None:
+            return manifest['version']
+
+        snapshot = self.get_latest()
+        return snapshot.encoded.digest if snapshot else None
+
+    def get(self, date):
+        """指定日のスナップショットを返す（データがなければNone）"""
+        path = self.refresh_index().get(date)
+        if path is None:
+            return None
+
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        key = (path, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            snapshot = self._snapshots.get(date)
+            if snapshot is not None and snapshot.key == key:
+                self._snapshots.move_to_end(date)
+                self._evict_over_limit()
+                return snapshot
+
+        # マップはロックの外で行い、他の日付の読み出しを止めない。
+        # 置き換え前の版のマップは、配信中のレスポンスが参照し終えた時点で解放される
+        try:
+            with open(path, 'rb') as f:
+                # statの後に置き換えられた場合に備え、キーもマップするファイルから取り直す
+                stat = os.fstat(f.fileno())
+                key = (path, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+                snapshot = Snapshot(key, map_file(f, stat), read_precompressed(path, stat))
+        except FileNotFoundError:
+            return None
+
+        with self._lock:
+            self._snapshots.pop(date, None)
+            self._snapshots[date] = snapshot
+            self._evict_over_limit()
+        return snapshot
+
+    def get_latest(self):
+        """最新のスナップショットを返す（データがなければNone）"""
+        date = self.latest_date()
+        return self.get(date) if date else None
+
+    def _evict_over_limit(self):
+        """上限を超えている間、最も長く使われていないものから外す（直近に使ったものは残す）"""
+        cached_bytes = sum(snapshot.nbytes for snapshot in self._snapshots.values())
+        while cached_bytes > self.max_bytes and len(self._snapshots) > 1:
+            _, snapshot = self._snapshots.popitem(last=False)
+            cached_bytes -= snapshot.nbytes
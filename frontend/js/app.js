@@ -1,4 +1,25 @@
 // アプリケーションのメインJS
+
+// Fear & Greed Indexの区分（スコアの上限・表示名・色）
+const FEAR_GREED_BANDS = [
+    { max: 25, label: '極度の恐怖', color: '#c62828' },
+    { max: 45, label: '恐怖', color: '#ef6c00' },
+    { max: 55, label: '中立', color: '#9e9e9e' },
+    { max: 75, label: '強欲', color: '#7cb342' },
+    { max: 100, label: '極度の強欲', color: '#2e7d32' },
+];
+
+// Fear & Greed Indexの構成指標の表示名
+const FEAR_GREED_INDICATOR_NAMES = {
+    market_momentum_sp500: '株価の勢い（S&P500）',
+    stock_price_strength: '株価の強さ（52週高値・安値）',
+    stock_price_breadth: '株価の幅（出来高）',
+    put_call_options: 'プット・コール比率',
+    market_volatility_vix: 'ボラティリティ（VIX）',
+    junk_bond_demand: 'ジャンク債需要',
+    safe_haven_demand: '安全資産需要',
+};
+
 class InvestmentDashboard {
     constructor() {
         this.data = null;
@@ -6,19 +27,68 @@ class InvestmentDashboard {
         this.currentTab = 'market';
         this.currentNasdaqPeriod = 'day';
         this.currentSP500Period = 'day';
+        this.chartTimeframe = '4h';
+        // 初回表示に必要なフィールドのみ先に取得し、残りはタブ表示時に取得
+        this.initialFields = ['date', 'last_updated', 'market', 'screenshots'];
+        this.tabSections = { news: 'news', indicators: 'indicators', column: 'column' };
+        this.sectionRequests = {};
+        // 表示中の日付（nullなら最新）
+        this.selectedDate = null;
+        // サーバーから通知された最新データのバージョン
+        this.version = null;
         this.init();
     }
 
     async init() {
         await this.loadData();
         this.setupEventListeners();
-        this.renderCurrentTab();
+        await this.renderCurrentTab();
         this.updateDateTime();
+        this.prefetchSections();
+        this.loadDates();
+        this.subscribeUpdates();
+    }
+
+    subscribeUpdates() {
+        if (!window.EventSource) return;
+
+        const source = new EventSource('/api/events');
+        source.addEventListener('snapshot', (event) => {
+            const { version } = JSON.parse(event.data);
+            // 初回はバージョンを記録するだけ
+            if (this.version !== null && version !== this.version) {
+                this.refreshLatest();
+            }
+            this.version = version;
+        });
+    }
+
+    async refreshLatest() {
+        // 過去日を表示中は切り替えない（日付一覧のみ更新）
+        if (!this.selectedDate) {
+            // ETagで再検証されるため、変更のないセクションは304で済む
+            this.sectionRequests = {};
+            await this.loadData();
+            await this.renderCurrentTab();
+            this.updateDateTime();
+            this.prefetchSections();
+        }
+        this.loadDates();
+    }
+
+    dataUrl(fields) {
+        const base = this.selectedDate ? `/api/data/${this.selectedDate}` : '/api/data';
+        return `${base}?fields=${fields.join(',')}`;
+    }
+
+    sectionUrl(section) {
+        // 過去日のデータはセクション別のエンドポイントがないため、フィールド指定で取得
+        return this.selectedDate ? this.dataUrl([section]) : `/api/${section}`;
     }
 
     async loadData() {
         try {
-            const response = await fetch('/api/data');
+            const response = await fetch(this.dataUrl(this.initialFields));
             this.data = await response.json();
             console.log('Data loaded:', this.data);
         } catch (error) {
@@ -27,6 +97,62 @@ class InvestmentDashboard {
         }
     }
 
+    loadSection(section) {
+        // 同じセクションの取得は1回にまとめる
+        if (!this.sectionRequests[section]) {
+            const data = this.data;
+            const url = this.sectionUrl(section);
+            this.sectionRequests[section] = fetch(url)
+                .then(response => {
+                    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                    return response.json();
+                })
+                .then(value => {
+                    // 取得中に日付が切り替わった場合は破棄
+                    if (this.data !== data) return;
+                    this.data[section] = this.selectedDate ? value[section] : value;
+                })
+                .catch(error => {
+                    delete this.sectionRequests[section];
+                    console.error(`Error loading ${section}:`, error);
+                });
+        }
+        return this.sectionRequests[section];
+    }
+
+    async loadDates() {
+        const select = document.getElementById('dateSelect');
+        if (!select) return;
+
+        try {
+            const response = await fetch('/api/dates');
+            const { dates, latest } = await response.json();
+            const current = this.selectedDate || latest;
+            select.innerHTML = dates.map(date =>
+                `<option value="${date}"${date === current ? ' selected' : ''}>${date}</option>`
+            ).join('');
+            select.onchange = () => {
+                this.selectDate(select.value === latest ? null : select.value);
+            };
+        } catch (error) {
+            console.error('Error loading dates:', error);
+        }
+    }
+
+    async selectDate(date) {
+        this.selectedDate = date;
+        this.sectionRequests = {};
+        await this.loadData();
+        await this.renderCurrentTab();
+        this.updateDateTime();
+        this.prefetchSections();
+    }
+
+    prefetchSections() {
+        // 初回表示の後、残りのセクションを裏で取得しておく
+        Object.values(this.tabSections).forEach(section => this.loadSection(section));
+    }
+
     setupEventListeners() {
         // タブ切り替え
         document.querySelectorAll('.tab-btn').forEach(btn => {
@@ -54,7 +180,14 @@ class InvestmentDashboard {
         this.renderCurrentTab();
     }
 
-    renderCurrentTab() {
+    async renderCurrentTab() {
+        if (!this.data) return;
+
+        const section = this.tabSections[this.currentTab];
+        if (section) {
+            await this.loadSection(section);
+        }
+
         switch(this.currentTab) {
             case 'market':
                 this.renderMarketTab();
@@ -80,8 +213,8 @@ class InvestmentDashboard {
     renderMarketTab() {
         if (!this.data || !this.data.market) return;
 
-        // Fear & Greed Index スクリーンショット
-        this.renderFearGreedScreenshot();
+        // Fear & Greed Index
+        this.renderFearGreed();
 
         // VIXチャート
         this.renderVIXChart();
@@ -93,6 +226,181 @@ class InvestmentDashboard {
         this.renderAICommentary();
     }
 
+    screenshotUrl(ref) {
+        // SHA-256のハッシュ以外は旧形式（Base64埋め込み）として扱う（サーバー側のscreenshot_urlと同じ）
+        if (/^[0-9a-f]{64}$/.test(ref)) {
+            return `/api/screenshots/${ref}`;
+        }
+        return `data:image/png;base64,${ref}`;
+    }
+
+    screenshotImage(ref, alt, style) {
+        // 旧形式（ハッシュ・Base64の文字列）は1枚の画像として表示
+        if (typeof ref === 'string') {
+            return `<img src="${this.screenshotUrl(ref)}" alt="${alt}" loading="lazy" decoding="async" style="${style}">`;
+        }
+
+        // サイズ・形式ごとの画像から、ブラウザが画面幅と対応形式に合うものを選ぶ
+        const srcset = (format) => ref.sizes
+            .filter(size => size[format])
+            .map(size => `${this.screenshotUrl(size[format])} ${size.width}w`)
+            .join(', ');
+        const sizes = `(max-width: 768px) 100vw, ${ref.width}px`;
+        const largest = ref.sizes[ref.sizes.length - 1];
+        const sources = ['avif', 'webp']
+            .filter(format => largest[format])
+            .map(format => `<source type="image/${format}" srcset="${srcset(format)}" sizes="${sizes}">`)
+            .join('');
+
+        return `
+            <picture>
+                ${sources}
+                <img src="${this.screenshotUrl(largest.png)}" srcset="${srcset('png')}" sizes="${sizes}"
+                     width="${ref.width}" height="${ref.height}" alt="${alt}" loading="lazy" decoding="async"
+                     style="${style}">
+            </picture>
+        `;
+    }
+
+    fearGreedBand(score) {
+        return FEAR_GREED_BANDS.find(band => score <= band.max) || FEAR_GREED_BANDS[FEAR_GREED_BANDS.length - 1];
+    }
+
+    renderFearGreed() {
+        const fearGreed = this.data.market.fear_greed;
+        const chartContainer = document.getElementById('fearGreedChart');
+        const indicatorsDiv = document.getElementById('fearGreedIndicators');
+
+        // JSONで取得できなかった場合はスクリーンショットで代替
+        if (!fearGreed || fearGreed.score == null) {
+            if (chartContainer) chartContainer.style.display = 'none';
+            if (indicatorsDiv) indicatorsDiv.innerHTML = '';
+            this.renderFearGreedScreenshot();
+            return;
+        }
+
+        const band = this.fearGreedBand(fearGreed.score);
+
+        const canvas = document.getElementById('fearGreedCanvas');
+        if (canvas) {
+            canvas.style.display = '';
+            this.drawFearGreedGauge(canvas, fearGreed.score);
+        }
+
+        const valueDiv = document.getElementById('fearGreedValue');
+        if (valueDiv) {
+            valueDiv.style.color = band.color;
+            valueDiv.innerHTML = `${Math.round(fearGreed.score)} <span class="fear-greed-rating">${band.label}</span>`;
+        }
+
+        // 前日・1週間前・1ヶ月前・1年前との比較
+        const historyDiv = document.getElementById('fearGreedHistory');
+        if (historyDiv) {
+            const labels = { close: '前日', '1_week': '1週間前', '1_month': '1ヶ月前', '1_year': '1年前' };
+            const previous = fearGreed.previous || {};
+            historyDiv.innerHTML = Object.entries(labels)
+                .filter(([key]) => previous[key] != null)
+                .map(([key, label]) => {
+                    const item = this.fearGreedBand(previous[key]);
+                    return `<div class="history-item"><span>${label}</span><span style="color: ${item.color}"><strong>${Math.round(previous[key])}</strong> ${item.label}</span></div>`;
+                })
+                .join('');
+        }
+
+        if (indicatorsDiv) {
+            indicatorsDiv.innerHTML = Object.entries(fearGreed.indicators || {})
+                .filter(([, item]) => item.score != null)
+                .map(([key, item]) => {
+                    const itemBand = this.fearGreedBand(item.score);
+                    return `<div class="history-item"><span>${FEAR_GREED_INDICATOR_NAMES[key] || key}</span><span style="color: ${itemBand.color}">${itemBand.label}</span></div>`;
+                })
+                .join('');
+        }
+
+        if (chartContainer) {
+            chartContainer.style.display = '';
+            this.renderFearGreedChart(chartContainer, fearGreed.history);
+        }
+    }
+
+    drawFearGreedGauge(canvas, score) {
+        // 高解像度ディスプレイでもぼやけないよう、表示サイズ×デバイスピクセル比で描画
+        const width = 300;
+        const height = 150;
+        const ratio = window.devicePixelRatio || 1;
+        canvas.width = width * ratio;
+        canvas.height = height * ratio;
+        canvas.style.width = `${width}px`;
+        canvas.style.height = `${height}px`;
+
+        const ctx = canvas.getContext('2d');
+        ctx.scale(ratio, ratio);
+
+        const centerX = width / 2;
+        const centerY = height - 10;
+        const radius = 120;
+        const angleOf = (value) => Math.PI + Math.PI * Math.min(Math.max(value, 0), 100) / 100;
+
+        // 区分ごとの円弧
+        let start = 0;
+        FEAR_GREED_BANDS.forEach(band => {
+            ctx.beginPath();
+            ctx.arc(centerX, centerY, radius, angleOf(start), angleOf(band.max));
+            ctx.lineWidth = 24;
+            ctx.strokeStyle = band.color;
+            ctx.stroke();
+            start = band.max;
+        });
+
+        // 針
+        const angle = angleOf(score);
+        ctx.beginPath();
+        ctx.moveTo(centerX, centerY);
+        ctx.lineTo(centerX + (radius - 30) * Math.cos(angle), centerY + (radius - 30) * Math.sin(angle));
+        ctx.lineWidth = 4;
+        ctx.lineCap = 'round';
+        ctx.strokeStyle = '#212121';
+        ctx.stroke();
+
+        ctx.beginPath();
+        ctx.arc(centerX, centerY, 6, 0, 2 * Math.PI);
+        ctx.fillStyle = '#212121';
+        ctx.fill();
+    }
+
+    renderFearGreedChart(container, history) {
+        // 既存のチャートをクリア
+        container.innerHTML = '';
+        if (!history || !history.time || history.time.length === 0) {
+            container.style.display = 'none';
+            return;
+        }
+
+        const chart = LightweightCharts.createChart(container, {
+            width: container.offsetWidth,
+            height: 250,
+            layout: {
+                backgroundColor: '#ffffff',
+                textColor: '#333333',
+            },
+            grid: {
+                vertLines: { color: '#e0e0e0' },
+                horzLines: { color: '#e0e0e0' },
+            },
+        });
+
+        const lineSeries = chart.addLineSeries({
+            color: '#667eea',
+            lineWidth: 2,
+        });
+        lineSeries.setData(history.time
+            .map((time, i) => ({ time: time, value: history.score[i] }))
+            .filter(point => point.value != null));
+
+        chart.timeScale().fitContent();
+        this.charts.fearGreed = chart;
+    }
+
     renderFearGreedScreenshot() {
         const container = document.querySelector('.fear-greed-meter');
         if (!container) return;
@@ -107,11 +415,11 @@ class InvestmentDashboard {
         if (this.data.screenshots && this.data.screenshots.fear_greed) {
             // スクリーンショットを表示
             if (valueDiv) {
-                valueDiv.innerHTML = `
-                    <img src="data:image/png;base64,${this.data.screenshots.fear_greed}" 
-                         alt="Fear & Greed Index" 
-                         style="max-width: 100%; height: auto; border-radius: 8px; box-shadow: 0 2px 8px rgba(0,0,0,0.1);">
-                `;
+                valueDiv.innerHTML = this.screenshotImage(
+                    this.data.screenshots.fear_greed,
+                    'Fear & Greed Index',
+                    'max-width: 100%; height: auto; border-radius: 8px; box-shadow: 0 2px 8px rgba(0,0,0,0.1);'
+                );
             }
             // 履歴の表示は削除（スクリーンショットに含まれているため）
             if (historyDiv) {
@@ -154,14 +462,7 @@ class InvestmentDashboard {
 
         // VIXデータをチャート用に変換
         if (this.data.market.vix && this.data.market.vix.history) {
-            const chartData = this.data.market.vix.history.map(item => ({
-                time: new Date(item.time).getTime() / 1000,
-                open: item.open,
-                high: item.high,
-                low: item.low,
-                close: item.close,
-            }));
-            candleSeries.setData(chartData);
+            candleSeries.setData(this.toCandles(this.data.market.vix.history));
         }
 
         chart.timeScale().fitContent();
@@ -209,14 +510,7 @@ class InvestmentDashboard {
 
         // 10年債先物データをチャート用に変換
         if (this.data.market.t_note_future && this.data.market.t_note_future.history) {
-            const chartData = this.data.market.t_note_future.history.map(item => ({
-                time: new Date(item.time).getTime() / 1000,
-                open: item.open,
-                high: item.high,
-                low: item.low,
-                close: item.close,
-            }));
-            candleSeries.setData(chartData);
+            candleSeries.setData(this.toCandles(this.data.market.t_note_future.history));
         }
 
         chart.timeScale().fitContent();
@@ -234,6 +528,30 @@ class InvestmentDashboard {
         }
     }
 
+    toCandles(history) {
+        // 旧形式（オブジェクトの配列、ISO形式の時刻）
+        if (Array.isArray(history)) {
+            return history.map(item => ({
+                time: new Date(item.time).getTime() / 1000,
+                open: item.open,
+                high: item.high,
+                low: item.low,
+                close: item.close,
+            }));
+        }
+
+        // 列形式（時間足ごとに time/open/high/low/close の配列）
+        const series = history[this.chartTimeframe];
+        if (!series) return [];
+        return series.time.map((time, i) => ({
+            time: time,
+            open: series.open[i],
+            high: series.high[i],
+            low: series.low[i],
+            close: series.close[i],
+        }));
+    }
+
     renderAICommentary() {
         const container = document.getElementById('aiCommentary');
         if (!container) return;
@@ -279,11 +597,11 @@ class InvestmentDashboard {
 
         // スクリーンショットを表示
         if (this.data.screenshots && this.data.screenshots.nasdaq100 && this.data.screenshots.nasdaq100[this.currentNasdaqPeriod]) {
-            container.innerHTML = `
-                <img src="data:image/png;base64,${this.data.screenshots.nasdaq100[this.currentNasdaqPeriod]}" 
-                     alt="NASDAQ 100 Heatmap - ${this.currentNasdaqPeriod}" 
-                     style="max-width: 100%; height: auto; border-radius: 8px;">
-            `;
+            container.innerHTML = this.screenshotImage(
+                this.data.screenshots.nasdaq100[this.currentNasdaqPeriod],
+                `NASDAQ 100 Heatmap - ${this.currentNasdaqPeriod}`,
+                'max-width: 100%; height: auto; border-radius: 8px;'
+            );
         } else {
             container.innerHTML = '<p>ヒートマップを読み込み中...</p>';
         }
@@ -323,11 +641,11 @@ class InvestmentDashboard {
 
         // スクリーンショットを表示
         if (this.data.screenshots && this.data.screenshots.sp500 && this.data.screenshots.sp500[this.currentSP500Period]) {
-            container.innerHTML = `
-                <img src="data:image/png;base64,${this.data.screenshots.sp500[this.currentSP500Period]}" 
-                     alt="S&P 500 Heatmap - ${this.currentSP500Period}" 
-                     style="max-width: 100%; height: auto; border-radius: 8px;">
-            `;
+            container.innerHTML = this.screenshotImage(
+                this.data.screenshots.sp500[this.currentSP500Period],
+                `S&P 500 Heatmap - ${this.currentSP500Period}`,
+                'max-width: 100%; height: auto; border-radius: 8px;'
+            );
         } else {
             container.innerHTML = '<p>ヒートマップを読み込み中...</p>';
         }